@@ -0,0 +1,88 @@
+# coding: utf-8
+"""Memory benchmark of the chat cache.
+
+Seeds a temporary SQLite database with `--chats` chats, each with `--groups`
+groups of `--members` members. Members of a chat are picked from its
+`--people` users, so the same alias is in several groups, like in real chats.
+Then all chats are loaded twice, as model instances (what the cache used to
+keep) and into a ChatCache, and the memory each of them takes is measured
+with tracemalloc and reported per cached group.
+
+    python -m benchmarks.memory --chats 200 --groups 10 --members 20 --people 40
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import tracemalloc
+
+from bot.models import database, chat_groups, Group, GroupUsers
+from bot.models.cache import ChatCache
+
+
+def seed(rng, chats, groups, members, people):
+    with database.atomic():
+        for chat_id in range(-chats, 0):
+            for index in range(groups):
+                group = Group.create(user=1, chat=chat_id, name=f'group{index}')
+                aliases = rng.sample(range(people), min(members, people))
+                GroupUsers.insert_many(
+                    [{'group': group, 'alias': f'@user{-chat_id}_{alias}'} for alias in aliases]).execute()
+    return list(range(-chats, 0))
+
+
+def measure(load):
+    """Bytes allocated by `load()`, that are still alive once it returns."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = load()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del kept
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--members', type=int, default=20)
+    parser.add_argument('--people', type=int, default=40, help='distinct users of a chat')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='where to write the results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.init(os.path.join(directory, 'memory.db'))
+        database.create_tables([Group, GroupUsers])
+        chat_ids = seed(random.Random(args.seed), args.chats, args.groups, args.members, args.people)
+        groups = args.chats * args.groups
+
+        def models():
+            return [list(chat_groups(chat_id)) for chat_id in chat_ids]
+
+        def cache():
+            chat_cache = ChatCache(maxsize=len(chat_ids))
+            for chat_id in chat_ids:
+                chat_cache.groups(chat_id)
+            return chat_cache
+
+        results = {name: measure(load) / groups for name, load in (('models', models), ('cache', cache))}
+        database.close()
+
+    print(f'{groups} groups of {args.members} members')
+    for name, size in results.items():
+        print(f'{name:<8}{size:>10.0f} bytes per group')
+    print(f'cache takes {results["cache"] / results["models"] * 100:.0f}% of the models')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
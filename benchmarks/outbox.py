@@ -0,0 +1,47 @@
+# coding: utf-8
+"""Offline outbox throughput benchmark.
+
+Sends a burst of notifications to many chats through the outbox with a
+FakeBot, that answers with RetryAfter like Telegram does when a chat gets
+more messages than allowed, and reports throughput and flood errors.
+
+    python -m benchmarks.outbox --chats 50 --messages 10 --latency 0.01
+"""
+import argparse
+import time
+from collections import Counter
+
+from bot.outbox import Outbox
+from bot.tests.fakes import FakeBot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=10, help='messages per chat')
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds every API call takes')
+    parser.add_argument('--global-limit', type=int, default=30, help='messages per second in total')
+    parser.add_argument('--chat-limit', type=int, default=5, help='messages per chat per --chat-period')
+    parser.add_argument('--chat-period', type=float, default=1.0)
+    parser.add_argument('--flood-limit', type=int, default=5, help='messages per chat per second the fake bot accepts')
+    args = parser.parse_args()
+
+    bot = FakeBot(latency=args.latency, flood_limit=args.flood_limit)
+    outbox = Outbox(global_limit=args.global_limit, chat_limit=args.chat_limit, chat_period=args.chat_period)
+    outbox.start()
+
+    started = time.perf_counter()
+    for index in range(args.messages):
+        for chat in range(args.chats):
+            outbox.send(bot, -chat - 1, f'notification {index}')
+    outbox.stop()
+    elapsed = time.perf_counter() - started
+
+    per_chat = Counter(data['chat_id'] for _, _, data in bot.calls)
+    print(f'messages: {len(bot.calls)}/{args.chats * args.messages}, elapsed: {elapsed:.2f} s, '
+          f'throughput: {len(bot.calls) / elapsed:.1f} messages/s')
+    print(f'flood errors: {bot._request.flooded}, messages per chat: {min(per_chat.values())}-{max(per_chat.values())}')
+
+
+if __name__ == '__main__':
+    main()
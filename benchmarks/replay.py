@@ -0,0 +1,198 @@
+# coding: utf-8
+"""Offline replay benchmark of the handlers.
+
+Seeds a temporary SQLite database with `--chats` group chats (and as many
+users with private collections), each with `--groups` groups of `--members`
+members. Then builds a random mix of synthetic updates (messages with and
+without mentions, inline queries, chosen results, menus, joins and leaves,
+group creation) and processes them one by one through the real dispatcher
+of bot/updater.py with a FakeBot.
+
+Throughput and p50/p99 latency of every handler are printed and written as
+JSON, so results of two commits can be compared with `--baseline`.
+
+    python -m benchmarks.replay --chats 100 --groups 10 --members 20 --updates 20000 --output replay.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from functools import wraps
+
+from telegram import Update
+
+from bot.updater import create_updater
+from bot.metrics import iter_handlers
+from bot.models import database, chat_cache, Group, GroupUsers
+from bot.tests.fakes import FakeBot, message_update, inline_query_update, callback_query_update
+from .webhook import percentile
+
+WORDS = 'hello there how are you doing today let us meet at five please check the logs again'.split()
+
+
+# Database
+# --------
+
+def seed(chats, groups, members):
+    """Creates the groups, returns ids of the groups by chat."""
+    group_ids = defaultdict(list)
+    with database.atomic():
+        for chat in range(1, chats + 1):
+            for chat_id in (-chat, chat):  # group chat and private collection of its owner
+                for index in range(groups):
+                    group = Group.create(user=chat, chat=chat_id, name=f'group{index}')
+                    group_ids[chat_id].append(group.id)
+                    GroupUsers.insert_many(
+                        [{'group': group, 'alias': f'@user{chat}_{index}_{number}'} for number in range(members)]
+                    ).execute()
+    return group_ids
+
+
+# Workload
+# --------
+
+def sentence(rng, mention=None):
+    words = rng.sample(WORDS, 6)
+    if mention is not None:
+        words.insert(rng.randrange(len(words)), mention)
+    return ' '.join(words)
+
+
+def workload(rng, amount, chats, groups, group_ids):
+    """Yields raw updates in the proportions a busy bot sees them."""
+    kinds = ['mention', 'message', 'inline', 'chosen', 'groups', 'open', 'join', 'leave', 'create']
+    weights = [25, 30, 25, 5, 4, 5, 2, 2, 2]
+    for kind in rng.choices(kinds, weights, k=amount):
+        chat = rng.randrange(1, chats + 1)
+        user = rng.randrange(1, chats + 1)
+        group = rng.randrange(groups)
+        if kind == 'mention':
+            yield message_update(sentence(rng, f'group{group}'), user, -chat)
+        elif kind == 'message':
+            yield message_update(sentence(rng), user, -chat)
+        elif kind == 'inline':
+            query = sentence(rng, f'group{group}')
+            yield inline_query_update(query[:rng.randrange(1, len(query) + 1)], user)
+        elif kind == 'chosen':
+            yield {'update_id': 0, 'chosen_inline_result': {
+                'result_id': str(group_ids[user][group]), 'query': '',
+                'from': {'id': user, 'first_name': 'Tester', 'is_bot': False}}}
+        elif kind == 'groups':
+            yield message_update('/groups', user, -chat)
+        elif kind == 'open':
+            yield callback_query_update(f'group.list.{group_ids[-chat][group]}', user, -chat)
+        elif kind in ('join', 'leave'):
+            yield callback_query_update(f'group.{kind}.{group_ids[-chat][group]}', user, -chat)
+        elif kind == 'create':
+            yield message_update('/create', user, user)
+            yield message_update(f'new{rng.randrange(10 ** 6)}', user, user)
+
+
+# Measuring
+# ---------
+
+def record(samples, name, callback):
+    @wraps(callback)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            samples[name].append(time.perf_counter() - started)
+    return wrapper
+
+
+def instrument(dispatcher, samples):
+    for group in dispatcher.groups:
+        for handler in iter_handlers(dispatcher.handlers[group]):
+            handler.callback = record(samples, handler.callback.__name__, handler.callback)
+
+
+def summary(latencies):
+    return {
+        'count': len(latencies),
+        'throughput': len(latencies) / sum(latencies) if sum(latencies) else None,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+def run(args):
+    bot = FakeBot()
+    dispatcher = create_updater(bot=bot).dispatcher
+    samples = defaultdict(list)
+    instrument(dispatcher, samples)
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        database.init(os.path.join(directory, 'replay.db'))
+        database.create_tables([Group, GroupUsers])
+        group_ids = seed(args.chats, args.groups, args.members)
+        chat_cache.clear()
+        updates = [Update.de_json(update, bot) for update in
+                   workload(rng, args.updates, args.chats, args.groups, group_ids)]
+
+        latencies = []
+        started = time.perf_counter()
+        for update in updates:
+            processed = time.perf_counter()
+            dispatcher.process_update(update)
+            latencies.append(time.perf_counter() - processed)
+        elapsed = time.perf_counter() - started
+        database.close()
+
+    return {
+        'config': {key: getattr(args, key) for key in ('chats', 'groups', 'members', 'updates', 'seed')},
+        'total': dict(summary(latencies), throughput=len(updates) / elapsed, api_calls=len(bot.calls)),
+        'handlers': {name: summary(values) for name, values in sorted(samples.items())},
+    }
+
+
+# Reporting
+# ---------
+
+def report(result, baseline=None):
+    rows = [('total', result['total'])] + list(result['handlers'].items())
+    print(f'{"handler":<28}{"count":>8}{"per s":>12}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for name, stats in rows:
+        line = f'{name:<28}{stats["count"]:>8}{stats["throughput"] or 0:>12.1f}' \
+               f'{stats["p50_ms"]:>10.3f}{stats["p99_ms"]:>10.3f}{stats["max_ms"]:>10.3f}'
+        previous = baseline and (baseline['total'] if name == 'total' else baseline['handlers'].get(name))
+        if previous:
+            line += f'   p50 {change(previous["p50_ms"], stats["p50_ms"])}, p99 {change(previous["p99_ms"], stats["p99_ms"])}'
+        print(line)
+
+
+def change(before, after):
+    return f'{(after - before) / before * 100:+.1f}%' if before else 'n/a'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--groups', type=int, default=10, help='groups per chat')
+    parser.add_argument('--members', type=int, default=10, help='members per group')
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='replay.json', help='where to write the results as JSON')
+    parser.add_argument('--baseline', help='results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    result = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    report(result, baseline)
+    with open(args.output, 'w') as file:
+        json.dump(result, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
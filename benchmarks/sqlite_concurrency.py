@@ -0,0 +1,91 @@
+# coding: utf-8
+"""SQLite read throughput under concurrent writers, per database profile.
+
+Readers load whole chats with `chat_groups()`, the query behind the chat
+cache; writers add and remove members in short transactions, the way the
+group controllers do.
+
+    python -m benchmarks.sqlite_concurrency --readers 4 --writers 2 --seconds 5
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from threading import Event, Thread
+
+from peewee import OperationalError
+
+from bot.models import database, chat_groups, Group, GroupUsers, PROFILES
+
+CHATS, GROUPS, MEMBERS = 200, 5, 10
+
+
+def seed():
+    with database.atomic():
+        for chat in range(CHATS):
+            for index in range(GROUPS):
+                group = Group.create(user=chat, chat=chat, name=f'group{index}')
+                GroupUsers.insert_many(
+                    [{'group': group, 'alias': f'@user{chat}_{index}_{number}'} for number in range(MEMBERS)]).execute()
+
+
+def reader(stopped, counts):
+    while not stopped.is_set():
+        try:
+            len(chat_groups(random.randrange(CHATS)))
+            counts['reads'] += 1
+        except OperationalError:
+            counts['errors'] += 1
+    database.close()
+
+
+def writer(stopped, counts):
+    while not stopped.is_set():
+        group_id = random.randrange(CHATS * GROUPS) + 1
+        try:
+            with database.atomic():
+                member = GroupUsers.create(group=group_id, alias=f'@writer{random.random()}')
+                member.delete_instance()
+            counts['writes'] += 1
+        except OperationalError:
+            counts['errors'] += 1
+    database.close()
+
+
+def run(profile, readers, writers, seconds):
+    with tempfile.TemporaryDirectory() as directory:
+        database.init(os.path.join(directory, f'{profile}.db'), pragmas=PROFILES[profile])
+        database.create_tables([Group, GroupUsers])
+        seed()
+        database.close()
+
+        stopped = Event()
+        counters = [{'reads': 0, 'writes': 0, 'errors': 0} for _ in range(readers + writers)]
+        threads = [Thread(target=reader, args=(stopped, counts)) for counts in counters[:readers]] + \
+                  [Thread(target=writer, args=(stopped, counts)) for counts in counters[readers:]]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stopped.set()
+        for thread in threads:
+            thread.join()
+
+    return {key: sum(counts[key] for counts in counters) / seconds for key in ('reads', 'writes', 'errors')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f'{"profile":<10}{"reads/s":>12}{"writes/s":>12}{"errors/s":>12}')
+    for profile in ('default', 'tuned'):
+        result = run(profile, args.readers, args.writers, args.seconds)
+        print(f'{profile:<10}{result["reads"]:>12.1f}{result["writes"]:>12.1f}{result["errors"]:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# coding: utf-8
+"""Cold start benchmark.
+
+Runs every startup stage in a fresh interpreter `--repeat` times and reports
+the median time it takes, how many modules get loaded and whether any test
+or integration dependency (pytest, tgintegration, Pyrogram) is among them.
+Results are written as JSON and can be compared with an earlier run (e.g.
+of another commit) via `--baseline`.
+
+    python -m benchmarks.startup --repeat 10 --output startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+STAGES = {
+    'import bot': 'import bot',
+    'import bot.updater': 'import bot.updater',
+    'create_updater': 'from bot.updater import create_updater; create_updater()',
+    # What bot.py does before polling; older commits built the Updater while importing bot.updater
+    'ready to poll': 'import bot.updater\n'
+                     'if hasattr(bot.updater, "create_updater"): bot.updater.create_updater()',
+}
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'seconds': elapsed,
+    'modules': len(sys.modules),
+    'test_modules': sorted(name for name in sys.modules
+                           if name.split('.')[0] in ('pytest', '_pytest', 'tgintegration', 'pyrogram')
+                           or name.startswith('bot.tests')),
+}}))
+'''
+
+
+def measure(statement, repeat):
+    """Stats of the statement, None if it fails (e.g. the stage doesn't exist in the measured commit)."""
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-c', PROBE.format(statement=statement)],
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        if process.returncode:
+            return None
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    return {
+        'median_ms': statistics.median(run['seconds'] for run in runs) * 1000,
+        'min_ms': min(run['seconds'] for run in runs) * 1000,
+        'modules': runs[-1]['modules'],
+        'test_modules': runs[-1]['test_modules'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', default='startup.json', help='where to write the results as JSON')
+    parser.add_argument('--baseline', help='results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = {}
+    print(f'{"stage":<22}{"median ms":>12}{"min ms":>10}{"modules":>10}  test modules')
+    for stage, statement in STAGES.items():
+        result = results[stage] = measure(statement, args.repeat)
+        if result is None:
+            print(f'{stage:<22}{"failed":>12}')
+            continue
+        line = f'{stage:<22}{result["median_ms"]:>12.1f}{result["min_ms"]:>10.1f}{result["modules"]:>10}  ' \
+               f'{len(result["test_modules"]) or "none"}'
+        if baseline.get(stage):
+            before = baseline[stage]['median_ms']
+            line += f'   {(result["median_ms"] - before) / before * 100:+.1f}% vs baseline'
+        print(line)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# coding: utf-8
+"""Micro-benchmark of alias validation.
+
+Times `validate_alias` on valid and invalid usernames and group names
+against the previous implementation, which built the alphabet and the regex
+on every call, and checks that both give the same results.
+
+    python -m benchmarks.validation --number 100000
+"""
+import argparse
+import re
+import timeit
+
+from bot.controllers.validation import validate_alias
+
+USERNAMES = {
+    'valid': ['@alice', 'bob_smith', '@charlie_1234', 'dave'],
+    'invalid': ['@ali ce', '@@bob', 'bob@smith', '@abc', 'x', '@b!ob', 'ivan-petrov'],
+}
+GROUP_NAMES = {
+    'valid': ['family', 'группа', 'team_42', 'ომეგა'],
+    'invalid': ['two words', 'ab', 'a' * 40, 'friends!', 'mañana'],
+}
+
+
+def _construct_alphabet():
+    return 'ՏyIэԵПЕΜეцхլвaeբPчαზΛbнTбՑзлОწыრვДSdიԼZβρMիХჯლЧСბжֆGъоаγKфთWVђՅNuաԿτΞզкшЦlπУЋгΚҐჰgQნФքօუFґԽկΖსყЫ' \
+           'խsЖΡΥXБგрνკԻkМЗեյԴտEჟԶjYλziеՆЈրΕсՍεκЬՄЪHoOЭІოხհΠգpBАՎფδНΣՖΦпմИმΒაfცrվйтtդԱьШΔοպՐιіΤwUԳКζxүდპDս' \
+           'ћυLиЙμΑЂქΝԲՀВևqφЛhΟσмТնցՊCRјҮՔРJcξՕΙnΓдГvmуტA'
+
+
+def reference(alias, use_at=True, use_alphabet=False):
+    """The implementation before bot/controllers/validation.py."""
+    if len(alias.split(' ')) > 1:
+        return False, 'Spaces are not accepted.'
+    if use_at and len(re.findall('@', alias)) > 1:
+        return False, 'Too many @ symbols.'
+    if use_at and '@' in alias and not alias.startswith('@'):
+        return False, 'Username starts with @.'
+    if not 2 < len(alias) < 33 or use_at and '@' in alias and not 5 < len(alias) < 34:
+        return False, 'Length of the username must be 3-32 symbols.'
+
+    alphabet = _construct_alphabet() if use_alphabet else ''
+    symbols = '@_' if use_at else '_'
+    if len(re.findall(f'[^{symbols}a-zA-Z{alphabet}\\d]+', alias)):
+        return False, 'Invalid symbols in the username.'
+    return True, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=100000, help='calls per input kind')
+    args = parser.parse_args()
+
+    print(f'{"input":<24}{"before µs":>12}{"after µs":>12}{"speedup":>10}')
+    for kind, inputs, options in (('username', USERNAMES, {'use_at': True}),
+                                  ('group name', GROUP_NAMES, {'use_at': False, 'use_alphabet': True})):
+        for validity, aliases in inputs.items():
+            for alias in aliases:
+                assert validate_alias(alias, **options) == reference(alias, **options), alias
+
+            timings = []
+            for function in (reference, validate_alias):
+                rounds = args.number // len(aliases)
+                seconds = timeit.timeit(lambda: [function(alias, **options) for alias in aliases], number=rounds)
+                timings.append(seconds / (rounds * len(aliases)) * 10 ** 6)
+            print(f'{validity + " " + kind:<24}{timings[0]:>12.2f}{timings[1]:>12.2f}{timings[0] / timings[1]:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# coding: utf-8
+"""Offline webhook latency benchmark.
+
+Serves the handlers of bot/updater.py through `Updater.start_webhook` with a
+FakeBot and a temporary database, POSTs recorded updates at the server and
+measures the time from sending an update to the first Bot API call the bot
+makes in response.
+
+    python -m benchmarks.webhook --updates benchmarks/updates.jsonl --repeat 20
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import tempfile
+import time
+from urllib.request import Request, urlopen
+
+from bot.updater import create_updater
+from bot.models import database, Group, GroupUsers
+from bot.tests.fakes import FakeBot
+
+USER, CHAT = 1001, -1001
+REQUEST_TIMEOUT = 10  # seconds for a POST to be accepted, the reply is awaited with --timeout
+
+
+def seed():
+    for chat, name, members in [(USER, 'devs', 3), (USER, 'ops', 6), (CHAT, 'team', 4), (CHAT, 'komanda', 2)]:
+        group = Group.create(user=USER, chat=chat, name=name)
+        GroupUsers.insert_many([{'group': group, 'alias': f'@{name}{index}'} for index in range(members)]).execute()
+
+
+def replay(url, updates, request, timeout):
+    latencies = []
+    for update in updates:
+        expected = len(request.calls) + 1
+        started = time.perf_counter()
+        urlopen(Request(url, json.dumps(update).encode(), {'Content-Type': 'application/json'}),
+                timeout=REQUEST_TIMEOUT).read()
+        if request.wait_for_calls(expected, timeout):
+            latencies.append(request.calls[expected - 1][0] - started)
+    return latencies
+
+
+def wait_for_server(updater, port, timeout=10):
+    """Waits until the webhook server accepts connections.
+
+    start_webhook binds and serves on a background thread, the first POST
+    (and updater.stop()) must not race it.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if updater.httpd is not None and updater.httpd.is_running:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                pass
+        time.sleep(0.01)
+    raise RuntimeError(f'The webhook server did not start on port {port}')
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', default=os.path.join(os.path.dirname(__file__), 'updates.jsonl'))
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--port', type=int, default=8444)
+    parser.add_argument('--timeout', type=float, default=1.0, help='seconds to wait for a reply')
+    args = parser.parse_args()
+
+    with open(args.updates) as file:
+        updates = [json.loads(line) for line in file if line.strip()]
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.init(os.path.join(directory, 'benchmark.db'))
+        database.create_tables([Group, GroupUsers])
+        seed()
+
+        bot = FakeBot()
+        updater = create_updater(bot=bot)
+        updater.start_webhook(listen='127.0.0.1', port=args.port, url_path='benchmark',
+                              webhook_url=f'http://127.0.0.1:{args.port}/benchmark')
+        try:
+            wait_for_server(updater, args.port)
+            started = time.perf_counter()
+            latencies = []
+            for _ in range(args.repeat):
+                latencies.extend(replay(f'http://127.0.0.1:{args.port}/benchmark', updates, bot._request, args.timeout))
+            elapsed = time.perf_counter() - started
+        finally:
+            updater.stop()
+            database.close()
+
+    sent = len(updates) * args.repeat
+    print(f'updates: {sent}, replied: {len(latencies)}, throughput: {sent / elapsed:.1f} updates/s')
+    if latencies:
+        print(f'update-to-reply latency, ms: mean {statistics.mean(latencies) * 1000:.2f}, '
+              f'p50 {percentile(latencies, 50) * 1000:.2f}, p99 {percentile(latencies, 99) * 1000:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,35 @@
 # coding: utf-8
-from bot.updater import *
-from bot.models import database, Group, GroupUsers
+from bot.settings import settings
+from bot.updater import configure_logging, create_updater, create_worker_pool, BackgroundServices
+from bot.models.migrations import migrate
+
+
+def start_webhook(updater):
+    # Bot API 4.x has no secret header, so the secret is kept in the url path
+    url_path = '/'.join(filter(None, [settings.webhook_path.strip('/'), settings.webhook_secret]))
+
+    updater.start_webhook(
+        listen=settings.webhook_listen,
+        port=settings.webhook_port,
+        url_path=url_path,
+        cert=settings.webhook_cert,
+        key=settings.webhook_key,
+        webhook_url=f"{settings.webhook_url.rstrip('/')}/{url_path}")
 
 
 if __name__ == '__main__':
-    database.create_tables([Group, GroupUsers])
-    updater.start_polling()
+    configure_logging()
+    migrate()
+    updater = create_updater()
+    worker_pool = create_worker_pool(updater.dispatcher)
+
+    services = BackgroundServices()
+    services.start()
+    if settings.mode == 'webhook':
+        start_webhook(updater)
+    else:
+        updater.start_polling()
     updater.idle()
+    if worker_pool:
+        worker_pool.shutdown()
+    services.stop()
@@ -1,5 +1 @@
 # coding: utf-8
-from . import models
-from . import updater
-from . import controllers
-from . import tests
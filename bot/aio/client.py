@@ -0,0 +1,181 @@
+# coding: utf-8
+import asyncio
+import json
+import ssl
+from urllib.parse import urlsplit
+
+import certifi
+from telegram.error import BadRequest, ChatMigrated, InvalidToken, NetworkError, RetryAfter, TelegramError, \
+    TimedOut, Unauthorized
+from telegram.files.inputfile import InputFile
+
+
+class AsyncBotClient:
+    """Bot API client on asyncio streams with a pool of keep-alive HTTP/1.1 connections.
+
+    `call()` returns the `result` of the response and raises the same
+    telegram.error exceptions as python-telegram-bot's Request does. Data
+    with a file (e.g. sendDocument) is uploaded as multipart/form-data.
+    """
+
+    def __init__(self, token, base_url='https://api.telegram.org', connections=32, timeout=10):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context(cafile=certifi.where()) if url.scheme == 'https' else None
+        self.path = f'{url.path.rstrip("/")}/bot{token}'
+        self.timeout = timeout
+        self._idle = []  # (reader, writer) of open connections
+        self._slots = None
+        self._connections = connections
+
+    async def call(self, method, data=None, timeout=None):
+        """Calls the method. `timeout` is the read timeout, e.g. the long polling time plus a margin."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._connections)
+        if InputFile.is_inputfile(data):
+            form = InputFile(data)
+            body, content_type = form.to_form(), form.content_type
+        else:
+            body, content_type = json.dumps(data or {}).encode('utf-8'), 'application/json'
+        async with self._slots:
+            # A pooled connection might have been closed by the server, so it gets one retry on a new one
+            for reused in (True, False):
+                connection = self._idle.pop() if reused and self._idle else None
+                if connection is None:
+                    reused = False
+                try:
+                    if connection is None:
+                        connection = await asyncio.wait_for(
+                            asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+                    status, keep_alive, payload = await asyncio.wait_for(
+                        self._request(connection, method, body, content_type), timeout or self.timeout)
+                except asyncio.TimeoutError:
+                    self._close(connection)
+                    raise TimedOut()
+                except (OSError, asyncio.IncompleteReadError, ValueError) as error:
+                    self._close(connection)
+                    if reused:
+                        continue
+                    raise NetworkError(f'{type(error).__name__}: {error}')
+
+                if keep_alive:
+                    self._idle.append(connection)
+                else:
+                    self._close(connection)
+                return _parse(status, payload)
+
+    def close(self):
+        while self._idle:
+            self._close(self._idle.pop())
+
+    async def _request(self, connection, method, body, content_type):
+        reader, writer = connection
+        writer.write(
+            f'POST {self.path}/{method} HTTP/1.1\r\n'
+            f'Host: {self.host}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: keep-alive\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+
+        status = int((await reader.readuntil(b'\r\n')).split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            payload = b''
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                payload += chunk[:-2]
+            keep_alive = headers.get('connection', '').lower() != 'close'
+        elif 'content-length' in headers:
+            payload = await reader.readexactly(int(headers['content-length']))
+            keep_alive = headers.get('connection', '').lower() != 'close'
+        else:
+            payload = await reader.read()
+            keep_alive = False
+        return status, keep_alive, payload
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            connection[1].close()
+
+
+def _parse(status, payload):
+    """Same handling of responses as telegram.utils.request.Request."""
+    try:
+        data = json.loads(payload.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError):
+        if 200 <= status <= 299:
+            raise TelegramError('Invalid server response')
+        data = {}
+
+    if 200 <= status <= 299 and data.get('ok'):
+        return data['result']
+
+    parameters = data.get('parameters') or {}
+    if parameters.get('migrate_to_chat_id'):
+        raise ChatMigrated(parameters['migrate_to_chat_id'])
+    if parameters.get('retry_after'):
+        raise RetryAfter(parameters['retry_after'])
+    message = data.get('description') or 'Unknown HTTPError'
+    if status in (401, 403):
+        raise Unauthorized(message)
+    if status == 400:
+        raise BadRequest(message)
+    if status == 404:
+        raise InvalidToken()
+    if status == 502:
+        raise NetworkError('Bad Gateway')
+    raise NetworkError(f'{message} ({status})')
+
+
+class LoopRequest:
+    """Replaces telegram.utils.request.Request of a Bot, sending its calls through an AsyncBotClient.
+
+    Lets the threaded controllers run in executor threads of the async
+    runtime and share its connections. Must not be used from the loop itself.
+    """
+
+    con_pool_size = 1
+
+    def __init__(self, client, loop):
+        self.client = client
+        self.loop = loop
+
+    def post(self, url, data, timeout=None):
+        if _running_loop() is self.loop:
+            raise RuntimeError('Blocking Bot call from the event loop, use AsyncBotClient.call() instead')
+        method = url.rsplit('/', 1)[-1]
+        future = asyncio.run_coroutine_threadsafe(self.client.call(method, data, timeout), self.loop)
+        return future.result()
+
+    def get(self, url, timeout=None):
+        return self.post(url, None, timeout)
+
+    def retrieve(self, url, timeout=None):
+        """Downloads a file. Runs in the calling executor thread, files aren't worth a pooled connection."""
+        from urllib.request import urlopen
+
+        with urlopen(url, timeout=timeout or self.client.timeout) as response:
+            return response.read()
+
+    def stop(self):
+        pass
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None  # no loop runs in this thread
@@ -0,0 +1,150 @@
+# coding: utf-8
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from telegram import ParseMode, Update
+from telegram.error import RetryAfter, TelegramError
+
+from ..controllers.notification import inline_answer, mention_reply
+from ..metrics import metrics
+from ..models import chat_cache
+from ..outbox import outbox
+from ..workers import ThreadSafeConversationHandler, update_key
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    """Receives updates with asyncio long polling and processes them on the event loop.
+
+    Inline queries and messages, that may mention groups, are answered on
+    the loop itself from the chat cache; a cache miss is loaded on the
+    executor. Everything else (commands, menus, conversations) goes to the
+    threaded dispatcher on the same bounded executor, whose Bot sends its
+    requests back through the loop (see LoopRequest).
+
+    Updates of the same user are processed one after another, like in
+    ChatWorkerPool; at most `max_updates` updates are in progress at once.
+    Mention replies are queued in the outbox, which must be started.
+    """
+
+    def __init__(self, client, dispatcher, workers=4, max_updates=1000, poll_timeout=30):
+        self.client = client
+        self.dispatcher = dispatcher
+        self.poll_timeout = poll_timeout
+        self.max_updates = max_updates
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='async-worker')
+        self._conversations = [handler for group in dispatcher.groups
+                               for handler in dispatcher.handlers[group]
+                               if isinstance(handler, ThreadSafeConversationHandler)]
+        self._lanes = {}          # key -> task of the last update of the key
+        self._latest_inline = {}  # user_id -> the last inline query of the user
+        self._slots = None
+        self._polling = None
+
+    async def run(self):
+        """Polls for updates until `stop()`, then waits for the updates in progress."""
+        self._slots = asyncio.Semaphore(self.max_updates)
+        await self.client.call('deleteWebhook')
+        self._polling = asyncio.ensure_future(self._poll())
+        try:
+            await self._polling
+        except asyncio.CancelledError:
+            pass
+        if self._lanes:
+            await asyncio.wait(list(self._lanes.values()))
+        self._executor.shutdown()
+
+    def stop(self):
+        if self._polling is not None:
+            self._polling.cancel()
+
+    def submit(self, update):
+        """Schedules the update after the previous ones of the same user."""
+        key = update_key(update)
+        if update.inline_query is not None:
+            self._latest_inline[update.effective_user.id] = update.inline_query
+        task = asyncio.ensure_future(self._run(self._lanes.get(key), update))
+        self._lanes[key] = task
+        task.add_done_callback(partial(self._done, key))
+        return task
+
+    async def _poll(self):
+        offset, delay = 0, 1
+        while True:
+            try:
+                updates = await self.client.call(
+                    'getUpdates', {'offset': offset, 'timeout': self.poll_timeout}, timeout=self.poll_timeout + 10)
+            except RetryAfter as error:
+                await asyncio.sleep(error.retry_after)
+                continue
+            except TelegramError as error:
+                logger.warning('Could not get updates: %s, retrying in %s seconds', error, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+
+            delay = 1
+            for data in updates:
+                offset = data['update_id'] + 1
+                await self._slots.acquire()
+                self.submit(Update.de_json(data, self.dispatcher.bot))
+
+    async def _run(self, previous, update):
+        if previous is not None:
+            await asyncio.wait([previous])
+        started = time.perf_counter()
+        try:
+            if update.inline_query is not None:
+                await self._inline_query(update)
+                metrics.observe('handler.inline_mode', time.perf_counter() - started)
+            elif self._mentions_only(update):
+                await self._message(update)
+                metrics.observe('handler.check_every_message', time.perf_counter() - started)
+            else:
+                await asyncio.get_event_loop().run_in_executor(
+                    self._executor, self.dispatcher.process_update, update)
+        except Exception:
+            logger.exception('An uncaught error was raised while processing the update')
+
+    def _done(self, key, task):
+        if self._lanes.get(key) is task:
+            del self._lanes[key]
+        if self._slots is not None:
+            self._slots.release()
+
+    def _mentions_only(self, update):
+        """Whether the update can only get to check_every_message in the dispatcher."""
+        message = update.message
+        if message is None or not message.text or message.text.startswith('/'):
+            return False
+        if message.chat_id == message.from_user.id:
+            return False  # Conversations are mostly private, and there is nothing to mention
+        key = (message.chat_id, message.from_user.id)
+        return not any(key in handler.conversations for handler in self._conversations)
+
+    async def _warm(self, chat_id):
+        if not chat_cache.cached(chat_id):
+            await asyncio.get_event_loop().run_in_executor(self._executor, chat_cache.groups, chat_id)
+
+    async def _inline_query(self, update):
+        user_id = update.effective_user.id
+        if self._latest_inline.get(user_id) is not update.inline_query:
+            metrics.count('inline.superseded')
+            return  # A newer query of the user is waiting, nobody will see this answer
+        del self._latest_inline[user_id]
+
+        await self._warm(user_id)
+        results, options = inline_answer(user_id, update.inline_query.query, int(update.inline_query.offset or 0))
+        data = {'inline_query_id': update.inline_query.id, 'results': [result.to_dict() for result in results]}
+        data.update((name, value) for name, value in options.items() if value is not None)
+        await self.client.call('answerInlineQuery', data)
+
+    async def _message(self, update):
+        await self._warm(update.message.chat_id)
+        reply = mention_reply(update.message)
+        if reply:
+            outbox.reply(update.message, reply, parse_mode=ParseMode.MARKDOWN)
@@ -1,4 +1,8 @@
 # coding: utf-8
+from . import admins
 from . import groups
+from . import inlinecache
+from . import mentions
 from . import notification
 from . import substitutegroup
+from . import transliteration
@@ -0,0 +1,92 @@
+# coding: utf-8
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from telegram import ChatMember
+from telegram.error import TelegramError
+
+from ..settings import settings
+
+
+class AdminCache:
+    """TTL cache of chat member statuses keyed by (chat_id, user_id).
+
+    A chat can also be warmed with the whole list of its administrators. Until
+    that list expires, any user missing from it is known to be a plain member.
+    """
+
+    def __init__(self, ttl=300, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._statuses = OrderedDict()        # (chat_id, user_id) -> (expires, status)
+        self._administrators = OrderedDict()  # chat_id -> expires
+        self._lock = Lock()
+
+    def get(self, chat_id, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._statuses.get((chat_id, user_id))
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            expires = self._administrators.get(chat_id)
+            if expires is not None and expires > now:
+                return ChatMember.MEMBER
+        return None
+
+    def set(self, chat_id, user_id, status):
+        with self._lock:
+            self._store(self._statuses, (chat_id, user_id), (time.monotonic() + self.ttl, status))
+
+    def set_administrators(self, chat_id, members):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for member in members:
+                self._store(self._statuses, (chat_id, member.user.id), (expires, member.status))
+            self._store(self._administrators, chat_id, expires)
+
+    def forget(self, chat_id, user_id):
+        with self._lock:
+            self._statuses.pop((chat_id, user_id), None)
+            self._administrators.pop(chat_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._statuses.clear()
+            self._administrators.clear()
+
+    def _store(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+
+admin_cache = AdminCache(ttl=settings.admin_cache_ttl, maxsize=settings.admin_cache_size)
+
+
+def get_status(bot, chat_id, user_id):
+    status = admin_cache.get(chat_id, user_id)
+    if status is not None:
+        return status
+
+    if chat_id != user_id and settings.admin_cache_warm:
+        try:
+            admin_cache.set_administrators(chat_id, bot.get_chat_administrators(chat_id))
+            return admin_cache.get(chat_id, user_id)
+        except TelegramError:
+            pass  # Fall back to the single member lookup
+
+    status = bot.get_chat_member(chat_id=chat_id, user_id=user_id).status
+    admin_cache.set(chat_id, user_id, status)
+    return status
+
+
+# Chat member updates
+# -------------------
+
+def chat_members_changed(bot, update):
+    message = update.effective_message
+    for user in message.new_chat_members + [message.left_chat_member]:
+        if user is not None:
+            admin_cache.forget(message.chat_id, user.id)
@@ -1,6 +1,5 @@
 # coding: utf-8
-import re
-from decouple import Config, RepositoryEnv
+from io import BytesIO, StringIO, TextIOWrapper
 
 from peewee import IntegrityError
 from telegram import ChatMember, Update, Bot
@@ -8,43 +7,25 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ParseMode
 from telegram.ext import ConversationHandler
 from telegram.utils.helpers import escape_markdown
 
-from ..models import database, Group, GroupUsers
+from ..models import database, chat_cache, load_group, Group, GroupUsers
+from ..models.transfer import export_groups, import_groups, read, write, file_format
+from ..outbox import outbox
+from ..settings import settings
 from .substitutegroup import group_bold_text, get_translitted
+from .validation import validate_alias, split_aliases
+from . import admins
 
-config = Config(RepositoryEnv('config.env'))
-CREATE_GROUP, GROUP_ADD_MEMBERS, GROUP_REMOVE_MEMBERS, GROUP_RENAME, GROUP_DELETE, GROUP_COPY = range(6)
+CREATE_GROUP, GROUP_ADD_MEMBERS, GROUP_REMOVE_MEMBERS, GROUP_RENAME, GROUP_DELETE, GROUP_COPY, GROUP_IMPORT = range(7)
+IMPORT_MAX_SIZE = 1024 ** 2  # bytes of an imported file
 
 
 # Internal functions
 # ------------------
 
 
-def _construct_alphabet():
-    return 'ՏyIэԵПЕΜეцхլвaeբPчαზΛbнTбՑзлОწыრვДSdიԼZβρMիХჯლЧСბжֆGъоаγKфთWVђՅNuաԿτΞզкшЦlπУЋгΚҐჰgQნФքօუFґԽկΖსყЫ' \
-           'խsЖΡΥXБგрνკԻkМЗեյԴտEჟԶjYλziеՆЈրΕсՍεκЬՄЪHoOЭІოხհΠգpBАՎფδНΣՖΦпմИმΒაfცrվйтtդԱьШΔοպՐιіΤwUԳКζxүდპDս' \
-           'ћυLиЙμΑЂქΝԲՀВևqφЛhΟσмТնցՊCRјҮՔРJcξՕΙnΓдГvmуტA'
-
-
-def _validate_alias(alias, use_at=True, use_alphabet=False):
-    if len(alias.split(' ')) > 1:
-        return False, 'Spaces are not accepted.'
-    if use_at and len(re.findall('@', alias)) > 1:
-        return False, 'Too many @ symbols.'
-    if use_at and '@' in alias and not alias.startswith('@'):
-        return False, 'Username starts with @.'
-    if not 2 < len(alias) < 33 or use_at and '@' in alias and not 5 < len(alias) < 34:
-        return False, 'Length of the username must be 3-32 symbols.'
-
-    alphabet = _construct_alphabet() if use_alphabet else ''
-    symbols = '@_' if use_at else '_'
-    if len(re.findall(f'[^{symbols}a-zA-Z{alphabet}\d]+', alias)):
-        return False, 'Invalid symbols in the username.'
-    return True, None
-
-
 def _build_group_menu(chat_id):
     keyboard = []
-    for group in Group.select().where(Group.chat == chat_id):
+    for group in chat_cache.groups(chat_id):
         keyboard.append([InlineKeyboardButton(
             text=f'{group.name} | {len(group.members)} member(s)',
             callback_data=f'group.list.{group.id}')])
@@ -59,6 +40,7 @@ def _build_group_menu(chat_id):
 
 def _build_action_menu(group, update):
     keyboard = []
+    members = chat_cache.members(group)
     if group.user == update.effective_user.id or _has_admin_rights(update):  # if creator
         message = f'Choose an action for {group_bold_text(group.name)} group.'
         keyboard.extend([[InlineKeyboardButton('Add members', callback_data=f'group.add.{group.id}'),
@@ -75,17 +57,16 @@ def _build_action_menu(group, update):
         keyboard.extend([[InlineKeyboardButton('Copy group', callback_data=f'group.copy.{group.id}')]])
         message = f'The {group_bold_text(group.name)} group.'
 
-    if GroupUsers.select().where((GroupUsers.group == group) &
-                                 (GroupUsers.alias == update.effective_user.name)).first():
+    if any(member.alias == update.effective_user.name for member in members):
         keyboard.extend([[InlineKeyboardButton('← Back', callback_data=f'group.exit'),
                           InlineKeyboardButton('Leave group', callback_data=f'group.leave.{group.id}')]])
     else:
         keyboard.extend([[InlineKeyboardButton('← Back', callback_data=f'group.exit'),
                           InlineKeyboardButton('Join group', callback_data=f'group.join.{group.id}')]])
 
-    if group.members:
+    if members:
         message = f'{message}\n\nMembers:'
-        for index, member in enumerate(group.members, 1):
+        for index, member in enumerate(members, 1):
             message = f'{message}\n{index}. {escape_markdown(member.alias[1:])}'
     else:
         message = f'{message}\n\n No members yet.'
@@ -111,9 +92,8 @@ def _construct_members_menu(group):
 
 
 def _has_admin_rights(update: Update):
-    bot = update.effective_message.bot
-    chat_member = bot.get_chat_member(chat_id=update.effective_chat.id, user_id=update.effective_user.id)
-    return chat_member.status in (ChatMember.ADMINISTRATOR, ChatMember.CREATOR)
+    status = admins.get_status(update.effective_message.bot, update.effective_chat.id, update.effective_user.id)
+    return status in (ChatMember.ADMINISTRATOR, ChatMember.CREATOR)
 
 
 # /create command
@@ -121,10 +101,15 @@ def _has_admin_rights(update: Update):
 
 @database.atomic()
 def group_create(bot, update):
-    # Checking, that user/chat has not exceeded the limit.
-    groups = Group.select().where(Group.chat == update.effective_message.chat_id)
-    if len(groups) > config('GROUP_LIMIT', cast=int):
-        update.effective_message.reply_text(f'You cannot have more that {config("GROUP_LIMIT", cast=int)} groups.')
+    # Checking, that user/chat has not exceeded the limit. Cached groups are counted for free, otherwise
+    # the database counts them instead of loading every group with its members.
+    chat_id = update.effective_message.chat_id
+    if chat_cache.cached(chat_id):
+        count = len(chat_cache.groups(chat_id))
+    else:
+        count = Group.select().where(Group.chat == chat_id).count()
+    if count > settings.group_limit:
+        update.effective_message.reply_text(f'You cannot have more that {settings.group_limit} groups.')
         return ConversationHandler.END
 
     update.effective_message.reply_text('Ok, send the name of the group. /cancel', quote=False)
@@ -134,7 +119,7 @@ def group_create(bot, update):
 @database.atomic()
 def group_create_complete(bot, update):
     # Check, if group name has more tha 32 letters
-    validated, message = _validate_alias(update.effective_message.text, use_at=False, use_alphabet=True)
+    validated, message = validate_alias(update.effective_message.text, use_at=False, use_alphabet=True)
 
     if not validated:
         update.effective_message.reply_text(f'Sorry, invalid alias. {message}')
@@ -146,6 +131,7 @@ def group_create_complete(bot, update):
             user=update.effective_message.from_user.id,
             chat=update.effective_message.chat_id,
             name=group_name)
+        chat_cache.invalidate(group.chat)
         update.effective_message.reply_text('Saved. You can see all of your /groups if you like.')
         return ConversationHandler.END
     except IntegrityError:  # Index fell down
@@ -165,7 +151,7 @@ def group_list(bot, update):
 @database.atomic()
 def group_open(bot, update, user_data):
     user_data['effective_group'] = int(update.callback_query.data.split('.')[-1])
-    kwargs = _build_action_menu(Group.get_by_id(user_data.get('effective_group')), update)
+    kwargs = _build_action_menu(load_group(user_data.get('effective_group')), update)
     update.effective_message.edit_text(**kwargs)
 
 
@@ -181,14 +167,16 @@ def group_exit(bot, update):
 @database.atomic()
 def group_join(bot, update):
     try:
-        group = Group.get_by_id(int(update.callback_query.data.split('.')[-1]))
-        if len(group.members) >= config("GROUP_MEMBERS_LIMIT", cast=int):
+        group = load_group(int(update.callback_query.data.split('.')[-1]))
+        if len(group.members) >= settings.group_members_limit:
             return update.callback_query.answer("Maximum amount of members in the group.")
         GroupUsers.create(group=group, alias=update.callback_query.from_user.name)
+        chat_cache.invalidate(group.chat)
 
         kwargs = _build_action_menu(group, update)
         update.effective_message.edit_text(**kwargs)
-        update.effective_message.reply_text(
+        outbox.reply(
+            update.effective_message,
             f"{update.callback_query.from_user.name} joined group {group_bold_text(group.name)}", quote=False, parse_mode=ParseMode.MARKDOWN)
     except IntegrityError:
         update.callback_query.answer("You're already in that group.")
@@ -196,17 +184,19 @@ def group_join(bot, update):
 
 @database.atomic()
 def group_leave(bot, update):
-    group = Group.get_by_id(int(update.callback_query.data.split('.')[-1]))
-    if not GroupUsers.select().where((GroupUsers.group == group) & (GroupUsers.alias == update.callback_query.from_user.name)):
+    group = load_group(int(update.callback_query.data.split('.')[-1]))
+    if not any(member.alias == update.callback_query.from_user.name for member in group.members):
         return update.callback_query.answer("You are not present in the group.")
 
     GroupUsers.delete().where(
         (GroupUsers.group == group) & (GroupUsers.alias == update.callback_query.from_user.name)
     ).execute()
+    chat_cache.invalidate(group.chat)
 
     kwargs = _build_action_menu(group, update)
     update.effective_message.edit_text(**kwargs)
-    update.effective_message.reply_text(
+    outbox.reply(
+        update.effective_message,
         f"{update.callback_query.from_user.name} left group {group_bold_text(group.name)}", quote=False, parse_mode=ParseMode.MARKDOWN)
 
 
@@ -214,19 +204,19 @@ def group_leave(bot, update):
 def group_add_members_enter(bot, update, user_data):
     user_data['effective_group'] = int(update.callback_query.data.split('.')[-1])
     user_data['tries'] = 3
-    group = Group.get_by_id(user_data.get('effective_group'))
+    group = load_group(user_data.get('effective_group'))
     if group.user != update.callback_query.from_user.id:
         if not _has_admin_rights(update):
             update.callback_query.answer('You are not allowed to add new members.')
             return ConversationHandler.END
-    if len(group.members) >= config('GROUP_MEMBERS_LIMIT', cast=int):
-        update.callback_query.answer(f'You can only have up to {config("GROUP_MEMBERS_LIMIT", cast=int)} users in the group.')
+    if len(group.members) >= settings.group_members_limit:
+        update.callback_query.answer(f'You can only have up to {settings.group_members_limit} users in the group.')
         return ConversationHandler.END
 
     update.callback_query.answer()
     update.effective_message.edit_text(
-        f'Ok, send usernames (like {update.effective_user.name}) one by one. '
-        f'When you will be ready, send /done for completing.',
+        f'Ok, send usernames (like {update.effective_user.name}) one by one, '
+        f'or several of them in one message. When you will be ready, send /done for completing.',
         reply_markup=InlineKeyboardMarkup([]))
     return GROUP_ADD_MEMBERS
 
@@ -234,11 +224,14 @@ def group_add_members_enter(bot, update, user_data):
 @database.atomic()
 def group_add_members(bot, update, user_data):
 
-    group = Group.get_by_id(user_data.get('effective_group'))
+    group = load_group(user_data.get('effective_group'))
+    aliases = split_aliases(update.effective_message.text)
+    if len(aliases) > 1:
+        return _add_members_bulk(update, user_data, group, aliases)
     try:
         # 1. Different handcrafted constraints
         alias = update.effective_message.text
-        validated, message = _validate_alias(alias, use_at=True)
+        validated, message = validate_alias(alias, use_at=True)
 
         if not validated:
             update.effective_message.reply_text(f'Sorry, invalid alias. {message}')
@@ -252,8 +245,9 @@ def group_add_members(bot, update, user_data):
 
         # 2. Adding user to the group
         GroupUsers.create(group=group, alias=alias)
+        chat_cache.invalidate(group.chat)
         update.effective_message.reply_text(f'Added `{escape_markdown(alias)}`', parse_mode=ParseMode.MARKDOWN)
-        if len(group.members) >= config('GROUP_MEMBERS_LIMIT', cast=int):
+        if len(group.members) + 1 >= settings.group_members_limit:
             kwargs = _build_action_menu(group, update)
             update.effective_message.reply_text(f'Maximum amount of members reached.')
             update.effective_message.reply_text(**kwargs)
@@ -267,11 +261,51 @@ def group_add_members(bot, update, user_data):
     return GROUP_ADD_MEMBERS
 
 
+def _add_members_bulk(update, user_data, group, aliases):
+    """Adds every valid alias of the list with one insert and replies with a single summary."""
+    existing = {member.alias for member in group.members}
+    added, duplicates, invalid = [], [], []
+    for alias in aliases:
+        validated, _ = validate_alias(alias, use_at=True)
+        if not validated:
+            invalid.append(alias)
+            continue
+        alias = alias if '@' in alias else f'@{alias}'
+        if alias in existing or alias in added:
+            duplicates.append(alias)
+        else:
+            added.append(alias)
+
+    room = max(settings.group_members_limit - len(group.members), 0)
+    added, skipped = added[:room], added[room:]
+    if added:
+        GroupUsers.insert_many([{'group': group, 'alias': alias} for alias in added]).on_conflict_ignore().execute()
+        chat_cache.invalidate(group.chat)
+
+    summary = [f'{title}: {" ".join(f"`{escape_markdown(alias)}`" for alias in items)}'
+               for title, items in (('Added', added), ('Already in the group', duplicates), ('Invalid', invalid),
+                                    (f'Not added, the group is limited to {settings.group_members_limit}', skipped))
+               if items]
+    update.effective_message.reply_text('\n'.join(summary), parse_mode=ParseMode.MARKDOWN)
+
+    if len(group.members) + len(added) >= settings.group_members_limit:
+        kwargs = _build_action_menu(group, update)
+        update.effective_message.reply_text(f'Maximum amount of members reached.')
+        update.effective_message.reply_text(**kwargs)
+        return ConversationHandler.END
+    if not added and not duplicates:
+        user_data['tries'] -= 1
+        if user_data['tries'] <= 0:
+            update.effective_message.reply_text('Exiting adding mode', quote=False)
+            return ConversationHandler.END
+    return GROUP_ADD_MEMBERS
+
+
 @database.atomic()
 def group_add_members_complete(bot, update, user_data):
     update.effective_message.reply_text('Saved new members.', quote=False)
 
-    kwargs = _build_action_menu(Group.get_by_id(user_data.get('effective_group')), update)
+    kwargs = _build_action_menu(load_group(user_data.get('effective_group')), update)
     update.effective_message.reply_text(**kwargs)
     return ConversationHandler.END
 
@@ -287,7 +321,7 @@ def group_remove_enter(bot, update, user_data):
         return ConversationHandler.END
 
     user_data['effective_group'] = int(update.callback_query.data.split('.')[-1])
-    group = Group.get_by_id(user_data.get('effective_group'))
+    group = load_group(user_data.get('effective_group'))
     if group.user != update.callback_query.from_user.id:
         if not _has_admin_rights(update):
             update.callback_query.answer('You are not allowed to remove members.')
@@ -296,7 +330,7 @@ def group_remove_enter(bot, update, user_data):
         update.callback_query.answer("There aren't any members in the group.")
         return ConversationHandler.END
 
-    keyboard = _construct_members_menu(Group.get_by_id(user_data.get('effective_group')))
+    keyboard = _construct_members_menu(group)
     update.effective_message.edit_text('Choose members to remove.', reply_markup=InlineKeyboardMarkup(keyboard))
     return GROUP_REMOVE_MEMBERS
 
@@ -305,14 +339,18 @@ def group_remove_enter(bot, update, user_data):
 def group_remove_members(bot, update, user_data):
     member_id = update.callback_query.data.split('.')[-1]
     user = GroupUsers.get_by_id(member_id)
-    update.callback_query.message.reply_text(
-        f"{user.alias} has been removed from {group_bold_text(user.group.name)}",
+    group = load_group(user.group_id)
+    outbox.reply(
+        update.callback_query.message,
+        f"{user.alias} has been removed from {group_bold_text(group.name)}",
         parse_mode=ParseMode.MARKDOWN, quote=False)
     user.delete_instance()
+    chat_cache.invalidate(group.chat)
 
-    keyboard = _construct_members_menu(Group.get_by_id(user_data.get('effective_group')))
+    group.members = [member for member in group.members if member.id != user.id]
+    keyboard = _construct_members_menu(group)
     if len(keyboard) == 1:
-        kwargs = _build_action_menu(Group.get_by_id(user_data.get('effective_group')), update)
+        kwargs = _build_action_menu(group, update)
         update.effective_message.edit_text(**kwargs)
     else:
         update.effective_message.edit_reply_markup(reply_markup=InlineKeyboardMarkup(keyboard))
@@ -321,7 +359,7 @@ def group_remove_members(bot, update, user_data):
 
 @database.atomic()
 def group_remove_exit(bot, update, user_data):
-    kwargs = _build_action_menu(Group.get_by_id(user_data.get('effective_group')), update)
+    kwargs = _build_action_menu(load_group(user_data.get('effective_group')), update)
     update.effective_message.edit_text(**kwargs)
     return ConversationHandler.END
 
@@ -331,7 +369,7 @@ def group_remove_exit(bot, update, user_data):
 
 def group_rename_enter(bot, update, user_data):
     user_data['effective_group'] = int(update.callback_query.data.split('.')[-1])
-    group = Group.get_by_id(user_data.get('effective_group'))
+    group = load_group(user_data.get('effective_group'))
     if group.user != update.callback_query.from_user.id:
         if not _has_admin_rights(update):
             update.callback_query.answer('You are not allowed to rename the group.')
@@ -344,15 +382,16 @@ def group_rename_enter(bot, update, user_data):
 
 @database.atomic()
 def group_rename_complete(bot, update, user_data):
-    validated, message = _validate_alias(update.effective_message.text, use_at=False, use_alphabet=True)
+    validated, message = validate_alias(update.effective_message.text, use_at=False, use_alphabet=True)
     if not validated:
         update.effective_message.reply_text(f'Sorry, invalid group name. {message}')
         return GROUP_RENAME
 
-    group = Group.get_by_id(user_data.get('effective_group'))
+    group = load_group(user_data.get('effective_group'))
     try:
         group.name = get_translitted(update.effective_message.text, case_insansitive=True)
         group.save()
+        chat_cache.invalidate(group.chat)
         update.effective_message.reply_text('Saved.')
     except IntegrityError:
         update.effective_message.reply_text("You've already created a group with that name. Try again or /cancel")
@@ -369,7 +408,7 @@ def group_rename_complete(bot, update, user_data):
 @database.atomic()
 def group_delete_enter(bot, update, user_data):
     user_data['effective_group'] = int(update.callback_query.data.split('.')[-1])
-    group = Group.get_by_id(user_data.get('effective_group'))
+    group = load_group(user_data.get('effective_group'))
     if group.user != update.callback_query.from_user.id:
         if not _has_admin_rights(update):
             update.callback_query.answer('You are not allowed to delete the group.')
@@ -386,17 +425,18 @@ def group_delete_enter(bot, update, user_data):
 
 @database.atomic()
 def group_delete_complete(bot, update, user_data):
-    group = Group.get_by_id(user_data.get('effective_group'))
+    group = load_group(user_data.get('effective_group'))
     action = update.callback_query.data.split('.')[-1]
 
     if action == 'yes':
         group_name = group.name
         group.delete_instance(recursive=True)
+        chat_cache.invalidate(group.chat)
         if update.effective_chat.id == update.effective_user.id:
             update.callback_query.answer('Group have been deleted')
         else:
             update.callback_query.answer()
-            update.effective_message.reply_text(f'Group {group_name} have been deleted', quote=False)
+            outbox.reply(update.effective_message, f'Group {group_name} have been deleted', quote=False)
         kwargs = _build_group_menu(update.effective_chat.id)
         update.effective_message.edit_text(**kwargs)
 
@@ -413,11 +453,11 @@ def group_delete_complete(bot, update, user_data):
 @database.atomic()
 def group_copy_enter(bot, update, user_data):
     user_data['effective_group'] = int(update.callback_query.data.split('.')[-1])
-    group = Group.get_by_id(user_data.get('effective_group'))
+    group = load_group(user_data.get('effective_group'))
 
     keyboard = [[InlineKeyboardButton('Yes', callback_data='group.copy.yes'),
                  InlineKeyboardButton('No', callback_data='group.copy.no')]]
-    if group.name in [item.name for item in Group.select().where(Group.chat == update.callback_query.from_user.id)]:
+    if group.name in [item.name for item in chat_cache.groups(update.callback_query.from_user.id)]:
         user_data['overwrite'] = True
         update.effective_message.edit_text(
             text='This will overwrite your group. Are you sure?',
@@ -431,7 +471,7 @@ def group_copy_enter(bot, update, user_data):
 
 @database.atomic()
 def group_copy_complete(bot, update, user_data):
-    group = Group.get_by_id(user_data.get('effective_group'))
+    group = load_group(user_data.get('effective_group'))
     action = update.callback_query.data.split('.')[-1]
 
     if action == 'yes':
@@ -446,11 +486,13 @@ def group_copy_complete(bot, update, user_data):
                 user=update.callback_query.from_user.id,
                 chat=update.callback_query.from_user.id,
                 name=group.name)
+            chat_cache.invalidate(new_group.chat)
 
         rows = []
         for member in group.members:
             rows.append({'group': new_group, 'alias': member.alias})
         GroupUsers.insert_many(rows).on_conflict_ignore().execute()
+        chat_cache.invalidate(new_group.chat)
 
         update.callback_query.answer(callback_message)
         kwargs = _build_group_menu(update.effective_chat.id)
@@ -460,4 +502,77 @@ def group_copy_complete(bot, update, user_data):
         kwargs = _build_action_menu(group, update)
         update.effective_message.edit_text(**kwargs)
 
-    return ConversationHandler.END
\ No newline at end of file
+    return ConversationHandler.END
+
+# /export and /import commands
+# ----------------------------
+
+def group_export(bot, update, args):
+    format = 'csv' if args and args[0].lower() == 'csv' else 'jsonl'
+    document = BytesIO()
+    text = TextIOWrapper(document, encoding='utf-8', newline='')
+    count = write(export_groups(update.effective_chat.id), text, format)
+    text.detach()  # flushes, and keeps the document open
+    if not count:
+        update.effective_message.reply_text("There are no groups to export. Use /create command to create a group.")
+        return
+
+    document.seek(0)
+    update.effective_message.reply_document(
+        document=document, filename=f'groups.{format}', caption=f'{count} group(s). Send /import to load them.')
+
+
+def group_import_enter(bot, update):
+    if update.effective_chat.id != update.effective_user.id and not _has_admin_rights(update):
+        update.effective_message.reply_text('Only admins can import groups to this chat.')
+        return ConversationHandler.END
+
+    update.effective_message.reply_text(
+        'Ok, send the file made with /export (JSON Lines or CSV). /cancel', quote=False)
+    return GROUP_IMPORT
+
+
+@database.atomic()
+def group_import_complete(bot, update):
+    document = update.effective_message.document
+    if (document.file_size or 0) > IMPORT_MAX_SIZE:
+        update.effective_message.reply_text(f'Sorry, the file is larger than {IMPORT_MAX_SIZE // 1024} KB.')
+        return GROUP_IMPORT
+
+    content = bot.get_file(document.file_id).download_as_bytearray()
+    skipped = []
+    try:
+        # Read the whole file (at most IMPORT_MAX_SIZE) first, so that a broken line imports nothing
+        groups = list(read(StringIO(content.decode('utf-8-sig'), newline=''), file_format(document.file_name or '')))
+    except (ValueError, UnicodeDecodeError) as error:
+        update.effective_message.reply_text(f'Sorry, the file could not be read. {error}')
+        return GROUP_IMPORT
+
+    added, members = import_groups(_imported_groups(groups, update, skipped))
+
+    message = f'Imported {added} group(s) and {members} member(s).'
+    if skipped:
+        message = f'{message} Skipped {", ".join(skipped)}: invalid names or over the limit.'
+    update.effective_message.reply_text(message)
+    return ConversationHandler.END
+
+
+def _imported_groups(groups, update, skipped):
+    """Groups of the file moved to this chat, within the limits and with valid names and members only."""
+    current = {group.name: {member.alias for member in group.members}
+               for group in chat_cache.groups(update.effective_chat.id)}
+    room = settings.group_limit - len(current)
+    for group in groups:
+        name = get_translitted(group['name'], case_insansitive=True)
+        if not validate_alias(name, use_at=False, use_alphabet=True)[0] or name not in current and room <= 0:
+            skipped.append(name)
+            continue
+        if name not in current:
+            current[name], room = set(), room - 1
+
+        members = [alias for alias in dict.fromkeys(group['members'])
+                   if alias.startswith('@') and validate_alias(alias)[0] and alias not in current[name]]
+        members = members[:max(settings.group_members_limit - len(current[name]), 0)]
+        current[name].update(members)
+        yield {'chat': update.effective_chat.id, 'user': update.effective_user.id, 'name': name, 'usage': 0,
+               'members': members}
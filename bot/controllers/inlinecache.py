@@ -0,0 +1,60 @@
+# coding: utf-8
+from collections import OrderedDict
+from os.path import commonprefix
+from threading import Lock
+
+from ..metrics import metrics
+from .substitutegroup import render_tokens, join_tokens
+
+
+class InlineCache:
+    """Remembers the last substituted inline query of every user.
+
+    Telegram sends a query for nearly every typed character, so a new query
+    usually extends (or shortens) the previous one. Tokens, that lie entirely
+    inside the common prefix of both queries, are reused and only the rest of
+    the query is rendered again.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._queries = OrderedDict()  # user_id -> (groups, query, rendered tokens)
+        self._lock = Lock()
+
+    def substitute(self, user_id, query, groups, groups_by_name):
+        with self._lock:
+            previous = self._queries.pop(user_id, None)
+
+        if previous is None or previous[0] is not groups:
+            metrics.count('inline.recomputed')
+            rendered = render_tokens(query, groups_by_name)
+        elif previous[1] == query:
+            metrics.count('inline.cached')
+            rendered = previous[2]
+        else:
+            rendered, start = _reusable(previous[2], len(commonprefix([previous[1], query])))
+            metrics.count('inline.extended' if rendered else 'inline.recomputed')
+            rendered = rendered + render_tokens(query[start:], groups_by_name)
+
+        with self._lock:
+            self._queries[user_id] = (groups, query, rendered)
+            while len(self._queries) > self.maxsize:
+                self._queries.popitem(last=False)
+        return join_tokens(rendered)
+
+    def clear(self):
+        with self._lock:
+            self._queries.clear()
+
+
+def _reusable(rendered, common):
+    """Tokens ending strictly before `common`; a token ending right at it might continue in the new query."""
+    end = 0
+    for index, item in enumerate(rendered):
+        if end + len(item[0]) >= common:
+            return rendered[:index], end
+        end += len(item[0])
+    return list(rendered), end
+
+
+inline_cache = InlineCache()
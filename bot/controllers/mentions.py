@@ -0,0 +1,75 @@
+# coding: utf-8
+from collections import deque
+
+from ..models import chat_cache
+
+
+# Aho-Corasick automaton
+# ----------------------
+
+class MentionMatcher:
+    """Multi-pattern matcher over the group names of a single chat.
+
+    All names are found in one pass over the text, no matter how many
+    groups the chat has.
+    """
+
+    def __init__(self, names=()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for name in names:
+            self._insert(name)
+        self._link()
+
+    def _insert(self, name):
+        if not name:
+            return
+        state = 0
+        for ch in name:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] += (name,)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find(self, text):
+        found, state = set(), 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+# Per-chat matchers
+# -----------------
+# A matcher is derived from the cached groups, so it is rebuilt whenever the
+# chat cache drops (or expires) the groups of the chat.
+
+def _matcher(groups):
+    return MentionMatcher({group.name for group in groups})
+
+
+def find(chat_id, text):
+    """Returns the names of all chat groups mentioned in the (translitted, lowercased) text."""
+    return chat_cache.derived(chat_id, 'mentions', _matcher).find(text)
@@ -1,80 +1,123 @@
 # coding: utf-8
 import datetime
+from collections import namedtuple
 from uuid import uuid4
 
 from telegram import ParseMode
-from transliterate.exceptions import LanguageDetectionError
 from telegram import InlineQueryResultArticle, InputTextMessageContent
 
-from ..models import database, Group
-from ..updater import config
+from ..models import chat_cache, usage_counter
+from ..settings import settings
+from ..outbox import outbox
 from .substitutegroup import *
+from .transliteration import translit_text
+from .inlinecache import inline_cache
+from . import mentions
 
 
 # Inline Query
 # ------------
 
-@database.atomic()
-def inline_mode(bot, update):
+INLINE_PAGE_SIZE = 49  # Telegram accepts up to 50 results, one of them is "Auto"
+# Results change with every edit of the groups, so Telegram may only reuse them briefly
+INLINE_CACHE_TIME = settings.inline_cache_time
+
+RenderedGroup = namedtuple('RenderedGroup', 'id title usage description suffix')
+
+
+def _render_groups(groups):
+    """Everything of a group result, that doesn't depend on the query. Returns groups by name and by usage."""
+    by_name = []
+    for group in groups:
+        by_name.append(RenderedGroup(
+            id=group.id,
+            title=group.name,
+            usage=group.usage,
+            description=group.aliases or 'Empty group',
+            suffix=f'\n\n{group_bold_text(group.name)} ({group.members_string or "Empty group"})'))
+    return tuple(by_name), tuple(sorted(by_name, key=lambda item: item.usage, reverse=True))
+
+
+def _groups_by_name(groups):
+    return {group.name: group for group in groups}
+
+
+def _ranked_groups(user_id):
+    by_name, by_usage = chat_cache.derived(user_id, 'inline', _render_groups)
+    pending = usage_counter.snapshot()
+    if pending and any(item.id in pending for item in by_name):
+        return sorted(by_name, key=lambda item: item.usage + pending[item.id], reverse=True)
+    return by_usage
+
+
+def inline_answer(user_id, query, offset):
+    """Results of the inline query and options of the answer. Shared with the async runtime."""
     results, auto_triggered = [], False
-    query = update.inline_query.query
 
-    if query:
+    if query and not offset:
         auto_triggered = True  # Automatic substitution was triggered
-        groups = Group.select().where(Group.chat == update.effective_user.id)
+        groups = chat_cache.groups(user_id)
+        groups_by_name = chat_cache.derived(user_id, 'by_name', _groups_by_name)
+        final, draft = inline_cache.substitute(user_id, query, groups, groups_by_name)
         results.append(InlineQueryResultArticle(
             id=uuid4(),
             title="Auto",
-            input_message_content=InputTextMessageContent(substitute_groups(query, groups), parse_mode=ParseMode.MARKDOWN),
-            description=substitute_groups(query, groups, draft=True)))
+            input_message_content=InputTextMessageContent(final, parse_mode=ParseMode.MARKDOWN),
+            description=draft))
 
-    for group in Group.select().where(Group.chat == update.effective_user.id).order_by(Group.usage.desc()):
-        members = ' '.join(member.alias for member in group.members).strip() or 'Empty group'
+    ranked = _ranked_groups(user_id)
+    for group in ranked[offset:offset + INLINE_PAGE_SIZE]:
         results.append(InlineQueryResultArticle(
             id=group.id,
-            title=f'{group.name}',
-            input_message_content=InputTextMessageContent(f'{query}\n\n{group_bold_text(group.name)} ({escape_markdown(members)})', parse_mode=ParseMode.MARKDOWN),
-            description=f'{members}'))
+            title=group.title,
+            input_message_content=InputTextMessageContent(query + group.suffix, parse_mode=ParseMode.MARKDOWN),
+            description=group.description))
+
+    if not offset and (not results and query or len(results) == 1 and auto_triggered):
+        return [], dict(is_personal=True, cache_time=INLINE_CACHE_TIME,
+                        switch_pm_text='Create own groups', switch_pm_parameter='start')
 
-    if not results and query or len(results) == 1 and auto_triggered:
-        return update.inline_query.answer([], is_personal=True,
-            switch_pm_text='Create own groups', switch_pm_parameter='start')
+    next_offset = str(offset + INLINE_PAGE_SIZE) if len(ranked) > offset + INLINE_PAGE_SIZE else None
+    return results, dict(is_personal=True, cache_time=INLINE_CACHE_TIME, next_offset=next_offset)
 
-    update.inline_query.answer(results, is_personal=True)
+
+def inline_mode(bot, update):
+    results, options = inline_answer(
+        update.effective_user.id, update.inline_query.query, int(update.inline_query.offset or 0))
+    update.inline_query.answer(results, **options)
 
 
-@database.atomic()
 def inline_chosen(bot, update):
     try:
-        q = (Group
-             .update({Group.usage: Group.usage + 1})
-             .where(Group.id == int(update.chosen_inline_result.result_id)))
-        q.execute()
+        group_id = int(update.chosen_inline_result.result_id)
     except ValueError:
-        pass  # int() get uuid4 string -> do nothing
+        return None  # int() get uuid4 string -> do nothing
+    usage_counter.increment(group_id, update.effective_user.id)
 
 
 # Checking every message
 # ----------------------
 
-def check_every_message(bot, update):
-    if update.effective_message.chat_id == update.effective_message.from_user.id:
+def mention_reply(message):
+    """Text of the reply to a message, that mentions groups of the chat, or None."""
+    if message.chat_id == message.from_user.id:
         return None  # Don't check anything, if this is self-conversation
-    if update.effective_message.forward_date: 
+    if message.forward_date: 
         return None  # Don't mention anyone, if this is a forwarded message
 
-    user_groups = Group.select().where(Group.chat == update.effective_chat.id)
-    try:
-        translitted = translit(update.effective_message.text, reversed=True)
-    except LanguageDetectionError:
-        translitted = update.effective_message.text
-
-    mentioned = []
-    for group in user_groups:
-        if group.name in translitted.lower() and group.id not in mentioned:
-            mentioned.append(group.id)
-            if group.members:
-                update.effective_message.reply_text(f"Guys {get_group_members_string(group)}, you have been mentioned.", parse_mode=ParseMode.MARKDOWN)
-            # else:
-            #     update.effective_message.reply_text(f"A group {group_bold_text(group.name)} was mentioned, but there are no members in it.", parse_mode=ParseMode.MARKDOWN)
+    translitted = translit_text(message.text)
+    names = mentions.find(message.chat_id, translitted.lower())
+    if not names:
+        return None
+
+    # One reply for all of the groups, mentioned in the message
+    mentioned = [group for group in chat_cache.groups(message.chat_id) if group.name in names and group.members]
+    if mentioned:
+        return f"Guys {', '.join(map(get_group_members_string, mentioned))}, you have been mentioned."
+    return None
 
+
+def check_every_message(bot, update):
+    reply = mention_reply(update.effective_message)
+    if reply:
+        outbox.reply(update.effective_message, reply, parse_mode=ParseMode.MARKDOWN)
@@ -1,90 +1,62 @@
-from transliterate import translit
-from transliterate.exceptions import LanguageDetectionError
-from telegram.utils.helpers import escape_markdown
+from itertools import groupby
+
+from .transliteration import translit_word
 
 
 # Support functions for substitute groups
 # ---------------------------------------
 
 
-def substitute_groups(message, groups, draft=False):
-    final_message = ""
-    last = []
-    overfit = False
-    word = ""
-    for ch in message:
-        if ch.isalpha():
-            word += ch
-        elif len(word) > 0:
-            final_message, is_tail = update_final_message(final_message, groups, last, word, draft)
-            if is_tail and not overfit:
-                overfit = is_tail
-
-            final_message += ch
-            word = ""
-        else:
-            final_message += ch
-            word = ""
+def substitute(message, groups):
+    """Substitutes groups in the message. Returns both the final and the draft rendering."""
+    return join_tokens(render_tokens(message, {group.name: group for group in groups}))
 
-    if len(word) > 0:
-        final_message, is_tail = update_final_message(final_message, groups, last, word, draft)
-        if is_tail and not overfit:
-            overfit = is_tail
 
-    if overfit and draft:
-        final_message += " (...)"
+def render_tokens(message, groups_by_name):
+    """Splits the message into words and separators and renders each of them.
 
-    if not draft and len(last) > 0:
-        final_message += "\n\n" + ' '.join(last)
+    Returns a (token, final, draft, tail) tuple per token, where tail is the
+    member list of a long group, that goes to the end of the final message.
+    """
+    rendered = []
+    for is_word, chars in groupby(message, str.isalpha):
+        token = ''.join(chars)
+        group = groups_by_name.get(get_translitted(token, False)) if is_word else None
 
-    return final_message
+        if group is None:
+            rendered.append((token, token, token, None))
+        elif len(group.members) > 4:
+            # Long groups are only highlighted in place, their members go to the tail
+            rendered.append((token, group_bold_text(token), group_bold_text(token), get_group_members_string(group)))
+        else:
+            rendered.append((token, get_group_members_string(group), get_group_members_string(group, draft=True), None))
+    return rendered
 
 
-def get_translitted(message, case_insansitive=True):
-    try:
-        translitted = translit(message, reversed=True)
-    except LanguageDetectionError:
-        translitted = message
+def join_tokens(rendered):
+    final = [item[1] for item in rendered]
+    draft = [item[2] for item in rendered]
+    tail = [item[3] for item in rendered if item[3] is not None]
 
+    if tail:
+        final.append('\n\n' + ' '.join(tail))
+        draft.append(' (...)')
+    return ''.join(final), ''.join(draft)
+
+
+def get_translitted(message, case_insansitive=True):
+    translitted = translit_word(message)
     if case_insansitive:
         translitted = translitted.lower()
     return translitted
 
 
-def update_final_message(final_message, groups, last, word, draft):
-    overfit = False
-    gr = find_group(groups, word)
-
-    if gr is not None:
-        clear_bold_group = group_bold_text(word)
-        group_string = get_group_members_string(gr, draft)
-        if len(gr.members) > 4:
-            last.append(group_string)
-            final_message += clear_bold_group
-            overfit = True
-        else:
-            final_message += group_string
-    else:
-        final_message += word
-
-    return final_message, overfit
-
-
-def find_group(groups, word: str):
-    group_tr = get_translitted(word, False)
-    gr = None
-    for item in groups:
-        if item.name == group_tr:
-            gr = item
-            break
-    return gr
-
-
 def get_group_members_string(group, draft: bool = False):
+    """Rendering of a CachedGroup (see bot.models.cache)."""
     name_group = group_bold_text(group.name)
     if len(group.members) == 0:
         return name_group
-    return '{} ({})'.format(name_group, '...' if draft else escape_markdown(' '.join(map(lambda x: x.alias, group.members))))
+    return '{} ({})'.format(name_group, '...' if draft else group.members_string)
 
 
 def group_bold_text(name):
@@ -0,0 +1,37 @@
+# coding: utf-8
+import re
+from functools import lru_cache
+
+from transliterate import translit
+from transliterate.exceptions import LanguageDetectionError
+
+WORD_CACHE_SIZE = 4096
+
+_non_ascii = re.compile('[^\x00-\x7f]')
+
+
+# Transliteration service
+# -----------------------
+# `translit(..., reversed=True)` detects the language of the text first and
+# raises LanguageDetectionError for plain ASCII, which is then returned as is.
+# ASCII text is passed through without any detection at all.
+
+def translit_text(text):
+    """Reversed transliteration of an arbitrary text, e.g. the whole message."""
+    if not _non_ascii.search(text):
+        return text
+    try:
+        return translit(text, reversed=True)
+    except LanguageDetectionError:
+        return text
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def translit_word(word):
+    """Memoized reversed transliteration of a single word or group name."""
+    return translit_text(word)
+
+
+def cache_info():
+    """Hits, misses and size of the word cache."""
+    return translit_word.cache_info()
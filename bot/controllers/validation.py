@@ -0,0 +1,37 @@
+# coding: utf-8
+import re
+
+# Letters accepted in group names, besides the latin ones
+ALPHABET = 'ՏyIэԵПЕΜეцхլвaeբPчαზΛbнTбՑзлОწыრვДSdიԼZβρMիХჯლЧСბжֆGъоаγKфთWVђՅNuաԿτΞզкшЦlπУЋгΚҐჰgQნФքօუFґԽկΖსყЫ' \
+           'խsЖΡΥXБგрνკԻkМЗեյԴտEჟԶjYλziеՆЈրΕсՍεκЬՄЪHoOЭІოხհΠգpBАՎფδНΣՖΦпմИმΒაfცrվйтtդԱьШΔοպՐιіΤwUԳКζxүდპDս' \
+           'ћυLиЙμΑЂქΝԲՀВևqφЛhΟσмТնցՊCRјҮՔРJcξՕΙnΓдГvmуტA'
+
+# The first symbol, that is not allowed, by (use_at, use_alphabet)
+_INVALID = {
+    (use_at, use_alphabet): re.compile(f'[^{"@_" if use_at else "_"}a-zA-Z{ALPHABET if use_alphabet else ""}\\d]')
+    for use_at in (True, False) for use_alphabet in (True, False)
+}
+
+
+def validate_alias(alias, use_at=True, use_alphabet=False):
+    """Checks a username (`use_at`) or a group name (`use_alphabet`). Returns (valid, error message)."""
+    if ' ' in alias:
+        return False, 'Spaces are not accepted.'
+    at = use_at and '@' in alias
+    if at and alias.count('@') > 1:
+        return False, 'Too many @ symbols.'
+    if at and alias[0] != '@':
+        return False, 'Username starts with @.'
+    if not 2 < len(alias) < 33 or at and not 5 < len(alias) < 34:
+        return False, 'Length of the username must be 3-32 symbols.'
+    if _INVALID[use_at, use_alphabet].search(alias):
+        return False, 'Invalid symbols in the username.'
+    return True, None
+
+
+_SEPARATORS = re.compile(r'[\s,]+')
+
+
+def split_aliases(text):
+    """Usernames of a whitespace or comma separated list."""
+    return [alias for alias in _SEPARATORS.split(text) if alias]
@@ -0,0 +1,247 @@
+# coding: utf-8
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from functools import wraps
+from threading import Event, Lock, Thread
+
+from telegram.ext import ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    """Thread-safe in-process counters, gauges and latency histograms.
+
+    Names are `<family>.<name>`, e.g. `handler.inline_mode`. While disabled
+    every method returns right away, and nothing gets wrapped by the
+    instrument_* functions below.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = Lock()
+        self._counters = defaultdict(int)
+        self._gauges = defaultdict(int)
+        self._timings = defaultdict(lambda: [[0] * (len(BUCKETS) + 1), 0, 0.0, 0.0])  # buckets, count, total, max
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] += amount
+
+    def gauge(self, name, delta):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[name] += delta
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            timing = self._timings[name]
+            timing[0][bisect_left(BUCKETS, seconds)] += 1
+            timing[1] += 1
+            timing[2] += seconds
+            timing[3] = max(timing[3], seconds)
+
+    def timed(self, name, func):
+        """Records latency of every call as `name` and raised exceptions as `errors.<name>`."""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                self.count(f'errors.{name}')
+                raise
+            finally:
+                self.observe(name, time.perf_counter() - started)
+        wrapper.instrumented = True
+        return wrapper
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timings': {name: {'count': count, 'total': total, 'max': maximum, 'mean': total / count,
+                                   'buckets': list(zip(BUCKETS + (float('inf'),), _cumulative(buckets)))}
+                            for name, (buckets, count, total, maximum) in self._timings.items()},
+            }
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+metrics = Metrics()
+
+
+def _cumulative(values):
+    total = 0
+    for value in values:
+        total += value
+        yield total
+
+
+# Instrumentation
+# ---------------
+
+def iter_handlers(handlers):
+    """Handlers of the list, including the ones nested in ConversationHandlers."""
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from iter_handlers(handler.entry_points)
+            for state in handler.states.values():
+                yield from iter_handlers(state)
+            yield from iter_handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def instrument_handlers(dispatcher):
+    """Wraps the callback of every registered handler, so its latency is recorded as `handler.<name>`."""
+    for group in dispatcher.groups:
+        for handler in iter_handlers(dispatcher.handlers[group]):
+            if not getattr(handler.callback, 'instrumented', False):
+                handler.callback = metrics.timed(f'handler.{handler.callback.__name__}', handler.callback)
+
+
+def instrument_database(database):
+    """Records every SQL statement as `db.<statement>`, e.g. `db.select`."""
+    execute_sql = database.execute_sql
+    if getattr(execute_sql, 'instrumented', False):
+        return
+
+    def wrapper(sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return execute_sql(sql, *args, **kwargs)
+        finally:
+            metrics.observe(f'db.{sql.split(None, 1)[0].lower()}', time.perf_counter() - started)
+
+    wrapper.instrumented = True
+    database.execute_sql = wrapper
+
+
+def instrument_bot(bot):
+    """Records every Bot API request as `api.<method>`."""
+    post = bot._request.post
+    if getattr(post, 'instrumented', False):
+        return
+
+    def wrapper(url, *args, **kwargs):
+        method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            return post(url, *args, **kwargs)
+        except Exception:
+            metrics.count(f'errors.api.{method}')
+            raise
+        finally:
+            metrics.observe(f'api.{method}', time.perf_counter() - started)
+
+    wrapper.instrumented = True
+    bot._request.post = wrapper
+
+
+# Exporting
+# ---------
+
+def prometheus(snapshot, prefix='substitute'):
+    """Snapshot in the Prometheus text format. The family becomes the metric, the rest of the name a label."""
+    lines = []
+    for kind, suffix in (('counters', '_total'), ('gauges', '')):
+        for family, items in _families(snapshot[kind]):
+            lines.append(f'# TYPE {prefix}_{family}{suffix} {"counter" if suffix else "gauge"}')
+            lines.extend(f'{prefix}_{family}{suffix}{{name="{name}"}} {value}' for name, value in items)
+
+    for family, items in _families(snapshot['timings']):
+        metric = f'{prefix}_{family}_seconds'
+        lines.append(f'# TYPE {metric} histogram')
+        for name, timing in items:
+            for bound, count in timing['buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric}_bucket{{name="{name}",le="{le}"}} {count}')
+            lines.append(f'{metric}_sum{{name="{name}"}} {timing["total"]}')
+            lines.append(f'{metric}_count{{name="{name}"}} {timing["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _families(values):
+    families = defaultdict(list)
+    for key, value in sorted(values.items()):
+        family, _, name = key.partition('.')
+        families[family].append((name, value))
+    return sorted(families.items())
+
+
+class MetricsServer:
+    """Serves the metrics on `http://<listen>:<port>/metrics` and logs them every `log_interval` seconds."""
+
+    def __init__(self, listen='127.0.0.1', port=9100, log_interval=0):
+        self.listen = listen
+        self.port = port
+        self.log_interval = log_interval
+        self._server = None
+        self._stopped = Event()
+        self._threads = []
+
+    def start(self):
+        if self.port:
+            from http.server import ThreadingHTTPServer  # only needed with metrics enabled
+            self._server = ThreadingHTTPServer((self.listen, self.port), _metrics_handler())
+            self._server.daemon_threads = True
+            self._threads.append(Thread(target=self._server.serve_forever, name='metrics-server', daemon=True))
+        if self.log_interval:
+            self._threads.append(Thread(target=self._log, name='metrics-log', daemon=True))
+        self._stopped.clear()
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _log(self):
+        while not self._stopped.wait(self.log_interval):
+            snapshot = metrics.snapshot()
+            timings = ', '.join(f'{name} {timing["count"]}x{timing["mean"] * 1000:.2f}ms'
+                                for name, timing in sorted(snapshot['timings'].items()))
+            logger.info('Metrics: counters %s, gauges %s, timings %s', snapshot['counters'], snapshot['gauges'], timings)
+
+
+def _metrics_handler():
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus(metrics.snapshot()).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes would flood the log
+
+    return MetricsHandler
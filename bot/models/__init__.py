@@ -1,2 +1,5 @@
 # coding: utf-8
-from .models import *
\ No newline at end of file
+from .models import *
+from .queries import chat_groups, load_group
+from .cache import chat_cache
+from .usage import usage_counter
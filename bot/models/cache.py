@@ -0,0 +1,147 @@
+# coding: utf-8
+from collections import OrderedDict
+from sys import intern
+from threading import RLock
+from time import monotonic
+
+from telegram.utils.helpers import escape_markdown
+
+from ..settings import settings
+from .models import database
+from .queries import chat_groups
+
+
+# Read model
+# ----------
+# The cache keeps plain slotted objects instead of model instances, which carry
+# a field dict and relation caches each. Names and aliases are interned, so an
+# alias added to many groups is stored once.
+
+class CachedMember:
+    __slots__ = ('id', 'alias')
+
+    def __init__(self, id, alias):
+        self.id = id
+        self.alias = intern(alias)
+
+
+class CachedGroup:
+    """Read-only group with its members and their rendering, that every controller needs anyway."""
+
+    __slots__ = ('id', 'user', 'chat', 'name', 'usage', 'members', 'aliases', 'members_string')
+
+    def __init__(self, group):
+        self.id = group.id
+        self.user = group.user
+        self.chat = group.chat
+        self.name = intern(group.name)
+        self.usage = group.usage
+        self.members = tuple(CachedMember(member.id, member.alias) for member in group.members)
+        self.aliases = ' '.join(member.alias for member in self.members)  # as typed in the inline results
+        self.members_string = escape_markdown(self.aliases)                # as sent with Markdown
+
+
+# Cache
+# -----
+
+class _Entry:
+    __slots__ = ('groups', 'derived', 'loaded')
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.derived = {}
+        self.loaded = monotonic()
+
+
+class ChatCache:
+    """Process-wide LRU cache of chat groups together with their members.
+
+    Groups are stored as CachedGroup objects with their members. Controllers
+    must never modify them; every mutation goes to
+    the database first and then invalidates the affected chat. Values derived
+    from the groups (e.g. rendered inline results) live in the same entry and
+    are dropped together with it.
+
+    Only this process invalidates entries. When several processes share the
+    database, `ttl` bounds how long one of them serves groups changed by another.
+    """
+
+    def __init__(self, maxsize=1024, ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._version = 0
+        self._lock = RLock()
+
+    def groups(self, chat_id):
+        with self._lock:
+            entry = self._fresh(chat_id)
+            if entry is not None:
+                self._entries.move_to_end(chat_id)
+                return entry.groups
+            version = self._version
+
+        groups = self._load(chat_id)
+        with self._lock:
+            # Don't store the result, if anything was invalidated while loading
+            if version == self._version:
+                self._entries[chat_id] = _Entry(groups)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return groups
+
+    def cached(self, chat_id):
+        """Whether groups of the chat can be returned without a query."""
+        with self._lock:
+            return self._fresh(chat_id) is not None
+
+    def derived(self, chat_id, name, factory):
+        """Value of `factory(groups)`, computed once per cached groups of the chat."""
+        groups = self.groups(chat_id)
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None and entry.groups is groups and name in entry.derived:
+                return entry.derived[name]
+
+        value = factory(groups)
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None and entry.groups is groups:
+                entry.derived[name] = value
+        return value
+
+    def group(self, chat_id, group_id):
+        for group in self.groups(chat_id):
+            if group.id == group_id:
+                return group
+        return None
+
+    def members(self, group):
+        cached = self.group(group.chat, group.id)
+        return cached.members if cached is not None else list(group.members)
+
+    def invalidate(self, chat_id):
+        self._drop(chat_id)
+        database.after_transaction(lambda: self._drop(chat_id))
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def _fresh(self, chat_id):
+        entry = self._entries.get(chat_id)
+        if entry is not None and self.ttl and monotonic() - entry.loaded > self.ttl:
+            return None
+        return entry
+
+    def _drop(self, chat_id):
+        with self._lock:
+            self._version += 1
+            self._entries.pop(chat_id, None)
+
+    def _load(self, chat_id):
+        return tuple(CachedGroup(group) for group in chat_groups(chat_id))
+
+
+chat_cache = ChatCache(settings.chat_cache_size, settings.chat_cache_ttl)
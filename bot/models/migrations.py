@@ -0,0 +1,138 @@
+# coding: utf-8
+"""Versioned schema migrations.
+
+Every migration runs once per database, in its own transaction, and is
+recorded in the `schema_version` table. Apply the pending ones with
+
+    python -m bot.models.migrations
+"""
+import logging
+from datetime import datetime
+
+from peewee import BigIntegerField, CharField, CompositeKey, DateTimeField, ForeignKeyField, IntegerField, Model
+from peewee import PostgresqlDatabase, TextField
+from playhouse.migrate import SchemaMigrator
+
+from .models import database
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_xact_lock key, so that workers starting together don't migrate twice
+LOCK_KEY = 0x5b57
+
+
+class SchemaVersion(Model):
+    class Meta:
+        database = database
+        table_name = 'schema_version'
+
+    version = IntegerField(primary_key=True)
+    name = CharField()
+    applied = DateTimeField(default=datetime.now)
+
+
+MIGRATIONS = []  # (version, name, function(migrator)), in order
+
+
+def migration(version, name):
+    def decorator(function):
+        MIGRATIONS.append((version, name, function))
+        return function
+    return decorator
+
+
+# Migrations
+# ----------
+# Migrations declare the tables they create as they were at that version, instead of using the
+# models, so that replaying the history gives the same schema whatever the models look like now.
+
+@migration(1, 'initial')
+def initial(migrator):
+    class Group(Model):
+        class Meta:
+            database = migrator.database
+            table_name = 'group'
+            indexes = (
+                (('chat', 'name'), True),
+            )
+
+        user = BigIntegerField()
+        chat = BigIntegerField()
+        name = CharField(max_length=32)
+        usage = IntegerField(default=0)
+
+    class GroupUsers(Model):
+        class Meta:
+            database = migrator.database
+            table_name = 'groupusers'
+            indexes = (
+                (('group', 'alias'), True),
+            )
+
+        group = ForeignKeyField(Group, backref='members')  # with the groupusers_group_id index
+        alias = CharField()
+
+    # Databases created before migrations existed already have the tables
+    migrator.database.create_tables([Group, GroupUsers], safe=True)
+
+
+@migration(2, 'persistence')
+def persistence(migrator):
+    class Conversation(Model):
+        class Meta:
+            database = migrator.database
+            table_name = 'conversation'
+            primary_key = CompositeKey('handler', 'key')
+
+        handler = CharField(max_length=32)
+        key = CharField()
+        state = TextField()
+
+    class UserData(Model):
+        class Meta:
+            database = migrator.database
+            table_name = 'userdata'
+
+        user = BigIntegerField(primary_key=True)
+        data = TextField()
+
+    migrator.database.create_tables([Conversation, UserData])
+
+
+@migration(3, 'indexes')
+def indexes(migrator):
+    # A prefix of groupusers_group_id_alias, it only slowed down every write of a member
+    migrator.database.execute_sql('DROP INDEX IF EXISTS "groupusers_group_id"')
+
+
+# Applying
+# --------
+
+def applied():
+    """Versions of the migrations, that the database already has."""
+    database.create_tables([SchemaVersion], safe=True)
+    return {row.version for row in SchemaVersion.select(SchemaVersion.version)}
+
+
+def migrate():
+    """Applies the pending migrations. Returns their versions."""
+    done, versions = applied(), []
+    migrator = SchemaMigrator.from_database(database)
+    for version, name, function in MIGRATIONS:
+        if version in done:
+            continue
+        with database.atomic():
+            if isinstance(database, PostgresqlDatabase):
+                database.execute_sql('SELECT pg_advisory_xact_lock(%s)', (LOCK_KEY,))
+                if SchemaVersion.select().where(SchemaVersion.version == version).exists():
+                    continue  # Another worker has just applied it
+            function(migrator)
+            SchemaVersion.create(version=version, name=name)
+        logger.info('Applied migration %s %s', version, name)
+        versions.append(version)
+    return versions
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    print(f'Applied {migrate() or "nothing, the database is up to date"}')
@@ -1,7 +1,10 @@
 # coding: utf-8
 from peewee import *
 
-database = SqliteDatabase('substitute.db')
+from ..settings import settings
+from .storage import PROFILES, create_database
+
+database = create_database(settings)
 
 
 class BaseModel(Model):
@@ -15,8 +18,9 @@ class Group(BaseModel):
             (('chat', 'name'), True),
         )
 
-    user = IntegerField()
-    chat = IntegerField()
+    # Telegram ids don't fit into 32 bits (PostgreSQL's integer), SQLite stores both the same way
+    user = BigIntegerField()
+    chat = BigIntegerField()
     name = CharField(max_length=32)
     usage = IntegerField(default=0)
 
@@ -27,5 +31,22 @@ class GroupUsers(BaseModel):
             (('group', 'alias'), True),
         )
 
-    group = ForeignKeyField(Group, backref='members')
+    # The unique (group, alias) index serves lookups by group as well
+    group = ForeignKeyField(Group, backref='members', index=False)
     alias = CharField()
+
+
+class Conversation(BaseModel):
+    """State of an unfinished conversation, see bot.persistence."""
+
+    class Meta:
+        primary_key = CompositeKey('handler', 'key')
+
+    handler = CharField(max_length=32)
+    key = CharField()    # JSON of the ConversationHandler key
+    state = TextField()  # JSON
+
+
+class UserData(BaseModel):
+    user = BigIntegerField(primary_key=True)
+    data = TextField()   # JSON
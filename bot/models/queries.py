@@ -0,0 +1,27 @@
+# coding: utf-8
+from peewee import prefetch
+
+from .models import Group, GroupUsers
+
+
+# Data access functions
+# ---------------------
+# Groups are always loaded together with their members, so that `group.members`
+# is a plain list and never issues a query of its own.
+
+def _members():
+    return GroupUsers.select().order_by(GroupUsers.id)
+
+
+def chat_groups(chat_id):
+    """All groups of the chat with members, ordered by name. Always 2 queries."""
+    groups = Group.select().where(Group.chat == chat_id).order_by(Group.name)
+    return prefetch(groups, _members())
+
+
+def load_group(group_id):
+    """A single group with members. Always 2 queries; raises Group.DoesNotExist like Group.get_by_id."""
+    groups = prefetch(Group.select().where(Group.id == group_id), _members())
+    if not groups:
+        raise Group.DoesNotExist(f'Group {group_id} does not exist.')
+    return groups[0]
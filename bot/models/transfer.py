@@ -0,0 +1,173 @@
+# coding: utf-8
+"""Export and import of groups as JSON Lines or CSV.
+
+Every group is one line (or row): chat, user, name, usage and members, a
+list in JSON Lines and space separated in CSV. Both directions work in
+chunks, so a whole database can be moved without loading it into memory:
+
+    python -m bot.models.transfer export groups.jsonl
+    python -m bot.models.transfer import groups.jsonl
+"""
+import argparse
+import csv
+import json
+import sys
+from collections import defaultdict
+from itertools import islice
+
+from .models import database, Group, GroupUsers
+from .cache import chat_cache
+
+FORMATS = ('jsonl', 'csv')
+COLUMNS = ('chat', 'user', 'name', 'usage', 'members')
+# Every group takes 4 SQL variables and every member 2, SQLite allows 999 of them
+GROUP_CHUNK = 200
+MEMBER_CHUNK = 400
+
+
+# Reading from the database
+# -------------------------
+
+def export_groups(chat_id=None, chunk=GROUP_CHUNK):
+    """Yields the groups of the chat (or all of them) as dicts, reading `chunk` groups at a time."""
+    query = Group.select().order_by(Group.id)
+    if chat_id is not None:
+        query = query.where(Group.chat == chat_id)
+
+    last = 0
+    while True:
+        groups = list(query.where(Group.id > last).limit(chunk))
+        if not groups:
+            return
+        members = defaultdict(list)
+        for group_id, alias in (GroupUsers
+                                .select(GroupUsers.group, GroupUsers.alias)
+                                .where(GroupUsers.group.in_([group.id for group in groups]))
+                                .order_by(GroupUsers.id)
+                                .tuples()):
+            members[group_id].append(alias)
+        for group in groups:
+            yield {'chat': group.chat, 'user': group.user, 'name': group.name, 'usage': group.usage,
+                   'members': members[group.id]}
+        last = groups[-1].id
+
+
+# Writing to the database
+# -----------------------
+
+def import_groups(groups, chunk=GROUP_CHUNK):
+    """Adds the groups with their members. Existing groups (by chat and name) get only the missing members.
+
+    Should run in a transaction. Returns the numbers of added groups and members.
+    """
+    added_groups = added_members = 0
+    groups = iter(groups)
+    while True:
+        batch = list(islice(groups, chunk))
+        if not batch:
+            return added_groups, added_members
+
+        keys = {(group['chat'], group['name']) for group in batch}
+        ids = _group_ids(keys)
+        new = {}
+        for group in batch:
+            key = (group['chat'], group['name'])
+            if key not in ids and key not in new:
+                new[key] = {'chat': group['chat'], 'user': group['user'], 'name': group['name'],
+                            'usage': group.get('usage', 0)}
+        if new:
+            Group.insert_many(list(new.values())).on_conflict_ignore().execute()
+            ids = _group_ids(keys)
+
+        current = set(GroupUsers
+                      .select(GroupUsers.group, GroupUsers.alias)
+                      .where(GroupUsers.group.in_(list(ids.values())))
+                      .tuples())
+        rows = {}
+        for group in batch:
+            group_id = ids[(group['chat'], group['name'])]
+            for alias in group['members']:
+                if (group_id, alias) not in current:
+                    rows[(group_id, alias)] = {'group': group_id, 'alias': alias}
+        rows = list(rows.values())
+        for start in range(0, len(rows), MEMBER_CHUNK):
+            GroupUsers.insert_many(rows[start:start + MEMBER_CHUNK]).on_conflict_ignore().execute()
+
+        for chat_id in {chat for chat, _ in keys}:
+            chat_cache.invalidate(chat_id)
+        added_groups += len(new)
+        added_members += len(rows)
+
+
+def _group_ids(keys):
+    chats, names = {chat for chat, _ in keys}, {name for _, name in keys}
+    query = (Group
+             .select(Group.id, Group.chat, Group.name)
+             .where(Group.chat.in_(list(chats)) & Group.name.in_(list(names)))
+             .tuples())
+    return {(chat, name): group_id for group_id, chat, name in query if (chat, name) in keys}
+
+
+# File formats
+# ------------
+
+def write(groups, file, format='jsonl'):
+    """Writes the groups to a text file. Returns how many of them were written."""
+    count = 0
+    if format == 'csv':
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        for count, group in enumerate(groups, 1):
+            writer.writerow([group['chat'], group['user'], group['name'], group['usage'], ' '.join(group['members'])])
+    else:
+        for count, group in enumerate(groups, 1):
+            file.write(json.dumps(group, ensure_ascii=False) + '\n')
+    return count
+
+
+def read(file, format='jsonl'):
+    """Yields the groups of a text file. Raises ValueError on the first malformed line."""
+    if format == 'csv':
+        lines = enumerate(csv.DictReader(file), 2)
+    else:
+        lines = ((number, line) for number, line in enumerate(file, 1) if line.strip())
+
+    for number, line in lines:
+        try:
+            group = json.loads(line) if format != 'csv' else dict(line, members=(line['members'] or '').split())
+            yield {'chat': int(group['chat']), 'user': int(group['user']), 'name': str(group['name']),
+                   'usage': int(group.get('usage') or 0), 'members': [str(alias) for alias in group['members']]}
+        except (ValueError, TypeError, KeyError, AttributeError) as error:
+            raise ValueError(f'Line {number} is not a group: {error!r}') from None
+
+
+def file_format(filename):
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+
+# Command line
+# ------------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('action', choices=('export', 'import'))
+    parser.add_argument('file', help='the file to write or read, - for stdout/stdin')
+    parser.add_argument('--format', choices=FORMATS, help='by default, taken from the file extension')
+    parser.add_argument('--chat', type=int, help='export only the groups of this chat')
+    args = parser.parse_args()
+    format = args.format or file_format(args.file)
+
+    if args.action == 'export':
+        file = sys.stdout if args.file == '-' else open(args.file, 'w', encoding='utf-8', newline='')
+        with file:
+            count = write(export_groups(args.chat), file, format)
+        print(f'Exported {count} groups', file=sys.stderr)
+    else:
+        file = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8-sig', newline='')
+        with file, database.atomic():
+            groups, members = import_groups(read(file, format))
+        print(f'Imported {groups} groups and {members} members', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# coding: utf-8
+import logging
+from collections import Counter
+from threading import Event, Lock, Thread
+
+from peewee import Case
+
+from ..settings import settings
+from .models import database, Group
+from .cache import chat_cache
+
+logger = logging.getLogger(__name__)
+
+# Every id takes 3 SQL variables, SQLite allows 999 of them
+FLUSH_CHUNK = 300
+
+
+class UsageCounter:
+    """Coalesces `Group.usage` increments in memory and writes them in batches.
+
+    Pending increments are flushed once `threshold` of them are collected or
+    every `interval` seconds, in one UPDATE per chunk of groups.
+    """
+
+    def __init__(self, threshold=100, interval=30):
+        self.threshold = threshold
+        self.interval = interval
+        self._pending = Counter()   # group_id -> delta
+        self._flushing = Counter()  # deltas being written right now
+        self._chats = {}            # group_id -> chat_id, to invalidate the cache after flush
+        self._total = 0
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def increment(self, group_id, chat_id, amount=1):
+        with self._lock:
+            self._pending[group_id] += amount
+            self._chats[group_id] = chat_id
+            self._total += amount
+            total = self._total
+        if total >= self.threshold:
+            self.flush()
+
+    def pending(self, group_id):
+        """Increments of the group, that are not visible in the database (or the chat cache) yet."""
+        with self._lock:
+            return self._pending.get(group_id, 0) + self._flushing.get(group_id, 0)
+
+    def snapshot(self):
+        """All increments, that are not visible in the database (or the chat cache) yet."""
+        with self._lock:
+            return self._pending + self._flushing
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, Counter()
+            chats, self._chats = self._chats, {}
+            self._flushing.update(pending)
+            self._total = 0
+
+        try:
+            with database.atomic():
+                items = list(pending.items())
+                for start in range(0, len(items), FLUSH_CHUNK):
+                    chunk = items[start:start + FLUSH_CHUNK]
+                    (Group
+                     .update({Group.usage: Group.usage + Case(Group.id, chunk, 0)})
+                     .where(Group.id.in_([group_id for group_id, _ in chunk]))
+                     .execute())
+        except Exception:
+            logger.exception('Could not flush group usage, keeping it for the next flush')
+            with self._lock:
+                self._pending.update(pending)
+                self._chats.update({group_id: chat for group_id, chat in chats.items()
+                                    if group_id not in self._chats})
+                self._flushing.subtract(pending)
+                self._total += sum(pending.values())
+            return
+
+        for chat_id in set(chats.values()):
+            chat_cache.invalidate(chat_id)
+        with self._lock:
+            self._flushing.subtract(pending)
+            self._flushing += Counter()  # drop zero counts
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='usage-counter', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+
+usage_counter = UsageCounter(threshold=settings.usage_flush_threshold, interval=settings.usage_flush_interval)
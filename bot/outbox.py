@@ -0,0 +1,197 @@
+# coding: utf-8
+import logging
+import time
+from collections import OrderedDict, deque
+from threading import Condition, Thread
+
+from telegram import Chat
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from .metrics import metrics
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit:
+    """Sliding window, that allows at most `limit` sends per `period` seconds."""
+
+    __slots__ = ('limit', 'period', '_sent')
+
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self._sent = deque()
+
+    def delay(self, now):
+        """Seconds until the next send is allowed."""
+        while self._sent and now - self._sent[0] >= self.period:
+            self._sent.popleft()
+        if len(self._sent) < self.limit:
+            return 0
+        return self._sent[0] + self.period - now
+
+    def record(self, now):
+        self._sent.append(now)
+
+    def idle(self, now):
+        return self.delay(now) == 0 and not self._sent
+
+
+class _Chat:
+    __slots__ = ('messages', 'limit', 'not_before')
+
+    def __init__(self, limit):
+        self.messages = deque()
+        self.limit = limit
+        self.not_before = 0
+
+
+class Outbox:
+    """Sends notifications on a background thread within Telegram flood limits.
+
+    Messages are queued per chat and sent round-robin, at most `global_limit`
+    per second in total and `chat_limit` per `chat_period` seconds to a chat.
+    On flood control (RetryAfter) sending pauses for the requested time, on
+    network errors the message is retried with exponential backoff.
+
+    Until `start()` is called messages are sent right away in the calling
+    thread, as `reply_text()` would do.
+    """
+
+    def __init__(self, global_limit=30, chat_limit=20, chat_period=60, retries=3, backoff=1):
+        self.chat_limit = chat_limit
+        self.chat_period = chat_period
+        self.retries = retries
+        self.backoff = backoff
+        self._global = RateLimit(global_limit, 1)
+        self._chats = OrderedDict()  # chat_id -> _Chat, in round-robin order
+        self._paused_until = 0
+        self._condition = Condition()
+        self._stopping = False
+        self._thread = None
+
+    def send(self, bot, chat_id, text, **kwargs):
+        if self._thread is None:
+            return bot.send_message(chat_id, text, **kwargs)
+
+        with self._condition:
+            chat = self._chat(chat_id)
+            chat.messages.append((bot, chat_id, text, kwargs, 0, time.monotonic()))
+            self._condition.notify()
+        metrics.gauge('outbox.queued', 1)
+
+    def reply(self, message, text, quote=None, **kwargs):
+        """Same as `message.reply_text()`, but through the outbox."""
+        if quote is None:
+            quote = message.chat.type != Chat.PRIVATE
+        if quote:
+            kwargs.setdefault('reply_to_message_id', message.message_id)
+        return self.send(message.bot, message.chat_id, text, **kwargs)
+
+    def start(self):
+        self._stopping = False
+        self._thread = Thread(target=self._run, name='outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Sends everything, that is queued, and stops the thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                task = self._next()
+                while task is None:
+                    wait = self._wait()
+                    if wait is None and self._stopping:
+                        return
+                    self._condition.wait(wait)
+                    task = self._next()
+            self._deliver(*task)
+
+    def _next(self):
+        """Pops the next message, that may be sent right now, and records the send."""
+        now = time.monotonic()
+        if now < self._paused_until or self._global.delay(now):
+            return None
+        for chat_id, chat in self._chats.items():
+            if chat.messages and now >= chat.not_before and not chat.limit.delay(now):
+                self._chats.move_to_end(chat_id)
+                self._global.record(now)
+                chat.limit.record(now)
+                return chat.messages.popleft()
+        self._prune(now)
+        return None
+
+    def _wait(self):
+        """Seconds until `_next()` may find something to send, None if nothing is queued."""
+        now = time.monotonic()
+        delays = [max(chat.not_before - now, chat.limit.delay(now)) for chat in self._chats.values() if chat.messages]
+        if not delays:
+            return None
+        return max(min(delays), self._global.delay(now), self._paused_until - now, 0.001)
+
+    def _chat(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(RateLimit(self.chat_limit, self.chat_period))
+        return chat
+
+    def _prune(self, now):
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if not chat.messages and chat.limit.idle(now)]:
+            del self._chats[chat_id]
+
+    def _deliver(self, bot, chat_id, text, kwargs, attempt, queued):
+        try:
+            bot.send_message(chat_id, text, **kwargs)
+        except RetryAfter as error:
+            metrics.count('outbox.flood')
+            logger.warning('Flood control exceeded, pausing the outbox for %s seconds', error.retry_after)
+            self._retry(chat_id, (bot, chat_id, text, kwargs, attempt, queued), pause=error.retry_after)
+            return
+        except BadRequest as error:
+            # A NetworkError in python-telegram-bot, but sending the same message again fails the same way
+            metrics.count('outbox.dropped')
+            logger.error('Could not send a message to %s: %s', chat_id, error)
+        except NetworkError as error:  # TimedOut as well
+            if attempt < self.retries:
+                metrics.count('outbox.retried')
+                self._retry(chat_id, (bot, chat_id, text, kwargs, attempt + 1, queued),
+                            backoff=self.backoff * 2 ** attempt)
+                return
+            metrics.count('outbox.dropped')
+            logger.error('Could not send a message to %s after %s retries: %s', chat_id, attempt, error)
+        except TelegramError as error:
+            metrics.count('outbox.dropped')
+            logger.error('Could not send a message to %s: %s', chat_id, error)
+        except Exception:
+            metrics.count('outbox.dropped')
+            logger.exception('An uncaught error was raised while sending a message')
+        else:
+            metrics.count('outbox.sent')
+        metrics.gauge('outbox.queued', -1)
+        metrics.observe('outbox.latency', time.monotonic() - queued)
+
+    def _retry(self, chat_id, message, pause=0, backoff=0):
+        with self._condition:
+            chat = self._chat(chat_id)
+            chat.messages.appendleft(message)
+            if pause:
+                self._paused_until = time.monotonic() + pause
+            if backoff:
+                chat.not_before = time.monotonic() + backoff
+            self._condition.notify()
+
+
+outbox = Outbox(
+    global_limit=settings.outbox_global_limit,
+    chat_limit=settings.outbox_chat_limit,
+    chat_period=settings.outbox_chat_period,
+    retries=settings.outbox_retries)
@@ -0,0 +1,278 @@
+# coding: utf-8
+import json
+import logging
+import time
+from threading import Event, Lock, Thread
+
+from telegram import Update
+
+from .settings import settings
+from .models import database, Conversation, UserData
+from .workers import ThreadSafeConversationHandler
+
+logger = logging.getLogger(__name__)
+
+# Every row takes up to 3 SQL variables, SQLite allows 999 of them
+FLUSH_CHUNK = 300
+
+
+class Persistence:
+    """Keeps conversation states and `user_data` of a dispatcher, so that they survive a restart.
+
+    Changes are collected in memory and written in batches, once `threshold`
+    of them are pending and every `interval` seconds, so handlers never wait
+    for a write. Subclasses implement `load()`, `write()` and the single
+    lookups `load_conversation()` and `load_user_data()`.
+
+    Everything stored is restored on attach. A conversation or `user_data`
+    missing from memory later on is looked up in the storage, so a user moved
+    over from another process continues there once that process has flushed.
+    A lookup, that finds nothing, isn't repeated for `interval` seconds.
+    """
+
+    def __init__(self, threshold=100, interval=5):
+        self.threshold = threshold
+        self.interval = interval
+        self._conversations = {}  # (handler name, key) -> state, None for ended conversations
+        self._user_data = {}      # user_id -> copy of user_data, empty for cleared ones
+        self._saved = {}          # user_id -> user_data as it was last recorded
+        self._absent = {}         # (handler name, key) or user_id -> until when it isn't looked up again
+        self._job_queue = None
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    # Storage
+    # -------
+
+    def load(self):
+        """Returns `{handler name: {key: state}}` and `{user_id: user_data}`."""
+        raise NotImplementedError
+
+    def write(self, conversations, user_data):
+        """Stores the changes, same shape as the pending ones."""
+        raise NotImplementedError
+
+    def load_conversation(self, name, key):
+        """Returns the stored state of one conversation, None if there is none."""
+        raise NotImplementedError
+
+    def load_user_data(self, user_id):
+        """Returns the stored `user_data` of one user, None if there is none."""
+        raise NotImplementedError
+
+    # Recording
+    # ---------
+
+    def attach(self, dispatcher):
+        """Restores the stored state into the dispatcher and starts recording its changes.
+
+        Must be called before the dispatcher gets a worker pool, so that the
+        changes are recorded on the worker threads.
+        """
+        conversations, user_data = self.load()
+        for user_id, data in user_data.items():
+            dispatcher.user_data[user_id].update(data)
+            self._saved[user_id] = dict(data)
+
+        self._job_queue = dispatcher.job_queue
+        for group in dispatcher.groups:
+            for handler in dispatcher.handlers[group]:
+                if isinstance(handler, ThreadSafeConversationHandler) and handler.name:
+                    handler.persistence = self
+                    for key, state in conversations.get(handler.name, {}).items():
+                        self._restore(handler, key, state)
+
+        process_update = dispatcher.process_update
+
+        def process_and_record(update):
+            user = update.effective_user if isinstance(update, Update) else None
+            if user is not None and user.id not in dispatcher.user_data:
+                self.restore_user_data(dispatcher, user.id)
+            process_update(update)
+            if user is not None and user.id in dispatcher.user_data:
+                self.update_user_data(user.id, dispatcher.user_data[user.id])
+
+        dispatcher.process_update = process_and_record
+
+    def restore_conversation(self, handler, key):
+        """Looks up a conversation, that the handler doesn't have in memory."""
+        name = handler.name
+        state = self._lookup(self._conversations, (name, key), lambda: self.load_conversation(name, key))
+        if state is not None:
+            self._restore(handler, key, state)
+
+    def restore_user_data(self, dispatcher, user_id):
+        """Looks up `user_data`, that the dispatcher doesn't have in memory."""
+        data = self._lookup(self._user_data, user_id, lambda: self.load_user_data(user_id))
+        if data:
+            dispatcher.user_data[user_id].update(data)
+            with self._lock:
+                self._saved[user_id] = dict(data)
+
+    def update_conversation(self, name, key, state):
+        with self._lock:
+            self._conversations[(name, key)] = state
+            pending = len(self._conversations) + len(self._user_data)
+        if pending >= self.threshold:
+            self.flush()
+
+    def update_user_data(self, user_id, data):
+        with self._lock:
+            if data == self._saved.get(user_id, {}):
+                return
+            self._saved[user_id] = self._user_data[user_id] = dict(data)
+            pending = len(self._conversations) + len(self._user_data)
+        if pending >= self.threshold:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            now = time.monotonic()
+            self._absent = {entry: until for entry, until in self._absent.items() if until > now}
+            if not self._conversations and not self._user_data:
+                return
+            conversations, self._conversations = self._conversations, {}
+            user_data, self._user_data = self._user_data, {}
+
+        try:
+            self.write(conversations, user_data)
+        except Exception:
+            logger.exception('Could not store conversations, keeping them for the next flush')
+            with self._lock:
+                # Changes recorded in the meantime are newer
+                self._conversations = {**conversations, **self._conversations}
+                self._user_data = {**user_data, **self._user_data}
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='persistence', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def _lookup(self, pending, entry, load):
+        with self._lock:
+            if entry in pending:
+                return None  # Changed by this process, the storage is older
+            if self._absent.get(entry, 0) > time.monotonic():
+                return None
+        try:
+            value = load()
+        except Exception:
+            logger.exception('Could not look up %r', entry)
+            value = None
+        if value is None:
+            with self._lock:
+                self._absent[entry] = time.monotonic() + self.interval
+        return value
+
+    def _restore(self, handler, key, state):
+        handler.conversations[key] = state
+        if handler.conversation_timeout and self._job_queue is not None:
+            # The timeouts of the previous run are lost, so restored conversations get a full one
+            handler.timeout_jobs[key] = self._job_queue.run_once(
+                handler._trigger_timeout, handler.conversation_timeout, context=key)
+
+
+class MemoryPersistence(Persistence):
+    """Stores in the memory of the process, e.g. to keep conversations while the dispatcher is rebuilt."""
+
+    def __init__(self, threshold=100, interval=5):
+        super().__init__(threshold, interval)
+        self.conversations = {}  # name -> {key: state}
+        self.user_data = {}      # user_id -> user_data
+
+    def load(self):
+        return ({name: dict(states) for name, states in self.conversations.items()},
+                {user_id: dict(data) for user_id, data in self.user_data.items()})
+
+    def load_conversation(self, name, key):
+        return self.conversations.get(name, {}).get(key)
+
+    def load_user_data(self, user_id):
+        data = self.user_data.get(user_id)
+        return dict(data) if data is not None else None
+
+    def write(self, conversations, user_data):
+        for (name, key), state in conversations.items():
+            states = self.conversations.setdefault(name, {})
+            if state is None:
+                states.pop(key, None)
+            else:
+                states[key] = state
+        for user_id, data in user_data.items():
+            if data:
+                self.user_data[user_id] = data
+            else:
+                self.user_data.pop(user_id, None)
+
+
+class DatabasePersistence(Persistence):
+    """Stores in the Conversation and UserData tables of the bot database (SQLite or PostgreSQL)."""
+
+    def load(self):
+        conversations = {}
+        for row in Conversation.select():
+            conversations.setdefault(row.handler, {})[_key(row.key)] = json.loads(row.state)
+        user_data = {row.user: json.loads(row.data) for row in UserData.select()}
+        return conversations, user_data
+
+    def load_conversation(self, name, key):
+        row = Conversation.get_or_none((Conversation.handler == name) & (Conversation.key == json.dumps(key)))
+        return json.loads(row.state) if row is not None else None
+
+    def load_user_data(self, user_id):
+        row = UserData.get_or_none(UserData.user == user_id)
+        return json.loads(row.data) if row is not None else None
+
+    def write(self, conversations, user_data):
+        conversations = [(name, json.dumps(key), state) for (name, key), state in conversations.items()]
+        with database.atomic():
+            for start in range(0, len(conversations), FLUSH_CHUNK):
+                chunk = conversations[start:start + FLUSH_CHUNK]
+                for name in {name for name, _, _ in chunk}:
+                    keys = [key for row_name, key, _ in chunk if row_name == name]
+                    Conversation.delete().where((Conversation.handler == name) & Conversation.key.in_(keys)).execute()
+                rows = [{'handler': name, 'key': key, 'state': json.dumps(state)}
+                        for name, key, state in chunk if state is not None]
+                if rows:
+                    Conversation.insert_many(rows).execute()
+
+            user_data = list(user_data.items())
+            for start in range(0, len(user_data), FLUSH_CHUNK):
+                chunk = user_data[start:start + FLUSH_CHUNK]
+                UserData.delete().where(UserData.user.in_([user_id for user_id, _ in chunk])).execute()
+                rows = [{'user': user_id, 'data': json.dumps(data)} for user_id, data in chunk if data]
+                if rows:
+                    UserData.insert_many(rows).execute()
+
+
+def _key(stored):
+    """ConversationHandler keys are tuples, JSON turns them into lists."""
+    key = json.loads(stored)
+    return tuple(key) if isinstance(key, list) else key
+
+
+def create_persistence(settings):
+    """Persistence of the PERSISTENCE setting (`memory` or `database`), None if it is not set."""
+    kinds = {'memory': MemoryPersistence, 'database': DatabasePersistence}
+    if not settings.persistence:
+        return None
+    if settings.persistence not in kinds:
+        raise ValueError(f'Unknown PERSISTENCE {settings.persistence!r}, use one of {", ".join(kinds)}')
+    return kinds[settings.persistence](
+        threshold=settings.persistence_flush_threshold,
+        interval=settings.persistence_flush_interval)
+
+
+persistence = create_persistence(settings)
@@ -0,0 +1,143 @@
+# coding: utf-8
+import logging
+import os
+from threading import Event, Thread
+
+from decouple import Config, RepositoryEnv
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout')
+# Settings, that are read on every use and can be changed without a restart
+RELOADABLE = ('group_limit', 'group_members_limit', 'admin_cache_warm')
+
+
+class Settings:
+    """Configuration of the bot, read from config.env (or the environment) once."""
+
+    def __init__(self, config, path=None):
+        self.path = path
+
+        # Bot
+        self.token: str = config('TOKEN', default=None)
+        self.debug: bool = config('DEBUG', default=False, cast=bool)
+        self.bot_name: str = config('BOT_NAME', default=None)
+        self.log_file: str = config('LOG_FILE', default=None) or \
+            f'{(self.bot_name or "substitute").lower().lstrip("@")}.log'
+        self.mode: str = config('MODE', default='polling')
+        self.workers: int = config('WORKERS', default=0, cast=int)
+        self.reload_interval: int = config('SETTINGS_RELOAD_INTERVAL', default=0, cast=int)
+
+        # Webhook
+        self.webhook_url: str = config('WEBHOOK_URL', default=None)
+        self.webhook_path: str = config('WEBHOOK_PATH', default='')
+        self.webhook_secret: str = config('WEBHOOK_SECRET', default='')
+        self.webhook_listen: str = config('WEBHOOK_LISTEN', default='127.0.0.1')
+        self.webhook_port: int = config('WEBHOOK_PORT', default=8443, cast=int)
+        self.webhook_cert: str = config('WEBHOOK_CERT', default=None)
+        self.webhook_key: str = config('WEBHOOK_KEY', default=None)
+
+        # Async runtime (bot_async.py)
+        self.api_url: str = config('API_URL', default='https://api.telegram.org')
+        self.async_workers: int = config('ASYNC_WORKERS', default=4, cast=int)
+        self.async_connections: int = config('ASYNC_CONNECTIONS', default=32, cast=int)
+        self.async_max_updates: int = config('ASYNC_MAX_UPDATES', default=1000, cast=int)
+
+        # Limits
+        self.group_limit: int = config('GROUP_LIMIT', default=20, cast=int)
+        self.group_members_limit: int = config('GROUP_MEMBERS_LIMIT', default=30, cast=int)
+
+        # Database
+        self.database: str = config('DATABASE', default='substitute.db')
+        self.database_pool_size: int = config('DATABASE_POOL_SIZE', default=16, cast=int)
+        self.database_stale_timeout: int = config('DATABASE_STALE_TIMEOUT', default=300, cast=int)
+        self.database_profile: str = config('DATABASE_PROFILE', default='tuned')
+        self.sqlite_pragmas: dict = {pragma: config(f'SQLITE_{pragma.upper()}') for pragma in SQLITE_PRAGMAS
+                                     if config(f'SQLITE_{pragma.upper()}', default=None) is not None}
+
+        # Caches and batching
+        self.chat_cache_size: int = config('CHAT_CACHE_SIZE', default=1024, cast=int)
+        self.chat_cache_ttl: float = config('CHAT_CACHE_TTL', default=0, cast=float)
+        self.admin_cache_ttl: int = config('ADMIN_CACHE_TTL', default=300, cast=int)
+        self.admin_cache_size: int = config('ADMIN_CACHE_SIZE', default=10000, cast=int)
+        self.admin_cache_warm: bool = config('ADMIN_CACHE_WARM', default=False, cast=bool)
+        self.inline_cache_time: int = config('INLINE_CACHE_TIME', default=30, cast=int)
+        self.usage_flush_threshold: int = config('USAGE_FLUSH_THRESHOLD', default=100, cast=int)
+        self.usage_flush_interval: int = config('USAGE_FLUSH_INTERVAL', default=30, cast=int)
+
+        # Persistence of conversations and user_data
+        self.persistence: str = config('PERSISTENCE', default='')
+        self.persistence_flush_threshold: int = config('PERSISTENCE_FLUSH_THRESHOLD', default=100, cast=int)
+        self.persistence_flush_interval: float = config('PERSISTENCE_FLUSH_INTERVAL', default=5, cast=float)
+
+        # Outbox
+        self.outbox_global_limit: int = config('OUTBOX_GLOBAL_LIMIT', default=30, cast=int)
+        self.outbox_chat_limit: int = config('OUTBOX_CHAT_LIMIT', default=20, cast=int)
+        self.outbox_chat_period: float = config('OUTBOX_CHAT_PERIOD', default=60, cast=float)
+        self.outbox_retries: int = config('OUTBOX_RETRIES', default=3, cast=int)
+
+        # Metrics
+        self.metrics: bool = config('METRICS', default=False, cast=bool)
+        self.metrics_listen: str = config('METRICS_LISTEN', default='127.0.0.1')
+        self.metrics_port: int = config('METRICS_PORT', default=9100, cast=int)
+        self.metrics_log_interval: int = config('METRICS_LOG_INTERVAL', default=0, cast=int)
+
+    @classmethod
+    def load(cls, path='config.env'):
+        return cls(Config(RepositoryEnv(path)), path)
+
+    def reload(self):
+        """Reads the file again and applies the RELOADABLE settings. Returns names of the changed ones."""
+        fresh = Settings.load(self.path)
+        changed = [name for name in RELOADABLE if getattr(self, name) != getattr(fresh, name)]
+        for name in changed:
+            setattr(self, name, getattr(fresh, name))
+        return changed
+
+
+class SettingsWatcher:
+    """Reloads the settings every time their file is modified, checking it every `interval` seconds."""
+
+    def __init__(self, settings, interval=5):
+        self.settings = settings
+        self.interval = interval
+        self._modified = self._mtime()
+        self._stopped = Event()
+        self._thread = None
+
+    def check(self):
+        modified = self._mtime()
+        if modified == self._modified:
+            return
+        self._modified = modified
+        try:
+            changed = self.settings.reload()
+        except Exception:
+            logger.exception('Could not reload %s, keeping the current settings', self.settings.path)
+            return
+        if changed:
+            logger.info('Reloaded %s', ', '.join(f'{name}={getattr(self.settings, name)}' for name in changed))
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='settings-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _mtime(self):
+        try:
+            return os.stat(self.settings.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+
+settings = Settings.load()
@@ -0,0 +1,75 @@
+import pytest
+
+from bot.metrics import metrics
+from bot.models import database, chat_cache, Group, GroupUsers
+from bot.tests.fakes import USER_ID, CHAT_ID
+
+# Groups of the `groups` fixture, names with members
+GROUPS = {
+    'short': ['@ann', '@bob_x'],
+    'four': ['@a1', '@a2', '@a3', '@a4'],
+    'long': [f'@user_{index}' for index in range(5)],
+    'empty': [],
+}
+
+
+# Shared fixtures
+# ---------------
+
+@pytest.fixture
+def db():
+    database.init(':memory:')
+    database.create_tables([Group, GroupUsers])
+    chat_cache.clear()
+    yield database
+    database.drop_tables([Group, GroupUsers])
+    database.init('substitute.db')
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    executed = []
+    execute_sql = database.execute_sql
+
+    def counting(sql, *args, **kwargs):
+        if not sql.startswith(('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')):
+            executed.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    monkeypatch.setattr(database, 'execute_sql', counting)
+    return executed
+
+
+@pytest.fixture
+def plans(monkeypatch):
+    """SQLite's EXPLAIN QUERY PLAN of every executed statement, as (sql, [details])."""
+    explained = []
+    execute_sql = database.execute_sql
+
+    def explaining(sql, params=None, *args, **kwargs):
+        if sql.startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE')):
+            plan = execute_sql(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+            explained.append((sql, [row[-1] for row in plan]))
+        return execute_sql(sql, params, *args, **kwargs)
+
+    monkeypatch.setattr(database, 'execute_sql', explaining)
+    return explained
+
+
+@pytest.fixture
+def groups(db):
+    """GROUPS in CHAT_ID, as cached groups."""
+    for name, aliases in GROUPS.items():
+        group = Group.create(user=USER_ID, chat=CHAT_ID, name=name)
+        if aliases:
+            GroupUsers.insert_many([{'group': group, 'alias': alias} for alias in aliases]).execute()
+    return chat_cache.groups(CHAT_ID)
+
+
+@pytest.fixture
+def enabled():
+    metrics.clear()
+    metrics.enabled = True
+    yield metrics
+    metrics.enabled = False
+    metrics.clear()
@@ -0,0 +1,175 @@
+import time
+from collections import defaultdict, deque
+from itertools import count
+from threading import Condition
+from telegram import Bot, ChatMember, Update, User
+from telegram.error import RetryAfter
+
+from bot.models import chat_cache, Group, GroupUsers
+
+USER_ID, CHAT_ID = 1, -100
+
+
+# Offline stand-ins for the Telegram API
+# --------------------------------------
+
+class FakeRequest:
+    """Replaces telegram.utils.request.Request and records every API call instead of sending it.
+
+    `latency` delays every call. `administrators` are the user ids, that
+    getChatAdministrators returns. With `flood_limit` set, sending more than
+    that many messages to a chat within `flood_period` seconds raises
+    RetryAfter, like Telegram does.
+    """
+
+    con_pool_size = 32
+
+    def __init__(self, member_status=ChatMember.MEMBER, latency=0, flood_limit=None, flood_period=1):
+        self.calls = []
+        self.flooded = 0
+        self.member_status = member_status
+        self.latency = latency
+        self.flood_limit = flood_limit
+        self.flood_period = flood_period
+        self.files = {}  # file_id -> content, that getFile and retrieve() serve
+        self.administrators = []
+        self._sent = defaultdict(deque)  # chat_id -> times of sent messages
+        self._ids = count(1)
+        self._condition = Condition()
+
+    def post(self, url, data, timeout=None):
+        method = url.rsplit('/', 1)[-1]
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'sendMessage' and self.flood_limit is not None:
+            self._check_flood(data['chat_id'])
+        with self._condition:
+            self.calls.append((time.perf_counter(), method, data))
+            self._condition.notify_all()
+        return self._result(method, data)
+
+    def retrieve(self, url, timeout=None):
+        return bytes(self.files[url.rsplit('/', 1)[-1]])
+
+    def wait_for_calls(self, amount, timeout=None):
+        """Blocks until at least `amount` calls have been recorded. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.calls) >= amount, timeout)
+
+    def stop(self):
+        pass
+
+    def _check_flood(self, chat_id):
+        now = time.perf_counter()
+        with self._condition:
+            sent = self._sent[chat_id]
+            while sent and now - sent[0] >= self.flood_period:
+                sent.popleft()
+            if len(sent) >= self.flood_limit:
+                self.flooded += 1
+                raise RetryAfter(sent[0] + self.flood_period - now)
+            sent.append(now)
+
+    def _result(self, method, data):
+        if method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            return {'message_id': next(self._ids), 'date': int(time.time()), 'text': data.get('text'),
+                    'chat': {'id': data.get('chat_id', 0), 'type': 'group'}}
+        if method == 'getChatMember':
+            return {'user': {'id': data['user_id'], 'first_name': 'Member', 'is_bot': False},
+                    'status': self.member_status}
+        if method == 'getChatAdministrators':
+            return [{'user': {'id': user_id, 'first_name': 'Admin', 'is_bot': False},
+                     'status': ChatMember.ADMINISTRATOR} for user_id in self.administrators]
+        if method == 'getMe':
+            return {'id': 0, 'first_name': 'Fake', 'is_bot': True, 'username': 'fake_bot'}
+        if method == 'getFile':
+            return {'file_id': data['file_id'], 'file_path': data['file_id'],
+                    'file_size': len(self.files.get(data['file_id'], b''))}
+        if method == 'getUpdates':
+            return []
+        return True
+
+
+class FakeBot(Bot):
+    def __init__(self, member_status=ChatMember.MEMBER, **request):
+        super().__init__('123456:fake-token-for-offline-tests')
+        self._request = FakeRequest(member_status, **request)
+        self.bot = User(0, 'Fake', True, username='fake_bot')
+
+    @property
+    def calls(self):
+        return self._request.calls
+
+
+# Synthetic updates
+# -----------------
+# Builders return raw update dicts, the way Telegram sends them, or Updates of a bot.
+
+_update_ids = count(1)
+
+
+def sender(user_id):
+    return {'id': user_id, 'first_name': 'Tester', 'is_bot': False, 'username': f'tester{user_id}'}
+
+
+def message_update(text, user_id, chat_id):
+    chat_type = 'private' if user_id == chat_id else 'group'
+    message = {'message_id': next(_update_ids), 'date': int(time.time()), 'text': text, 'from': sender(user_id),
+               'chat': {'id': chat_id, 'type': chat_type}}
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': next(_update_ids), 'message': message}
+
+
+def inline_query_update(query, user_id, offset=''):
+    inline_query = {'id': str(next(_update_ids)), 'query': query, 'offset': offset, 'from': sender(user_id)}
+    return {'update_id': next(_update_ids), 'inline_query': inline_query}
+
+
+def callback_query_update(data, user_id, chat_id):
+    chat_type = 'private' if user_id == chat_id else 'group'
+    message = {'message_id': next(_update_ids), 'date': int(time.time()), 'text': 'menu',
+               'chat': {'id': chat_id, 'type': chat_type}}
+    callback_query = {'id': str(next(_update_ids)), 'data': data, 'chat_instance': str(chat_id),
+                      'from': sender(user_id), 'message': message}
+    return {'update_id': next(_update_ids), 'callback_query': callback_query}
+
+
+def document_update(file_id, file_name, user_id, chat_id):
+    chat_type = 'private' if user_id == chat_id else 'group'
+    message = {'message_id': next(_update_ids), 'date': int(time.time()), 'from': sender(user_id),
+               'chat': {'id': chat_id, 'type': chat_type},
+               'document': {'file_id': file_id, 'file_name': file_name, 'file_size': 100}}
+    return {'update_id': next(_update_ids), 'message': message}
+
+
+def message(bot, text, user_id=USER_ID, chat_id=CHAT_ID):
+    return Update.de_json(message_update(text, user_id, chat_id), bot)
+
+
+def inline_query(bot, query, user_id=USER_ID):
+    return Update.de_json(inline_query_update(query, user_id), bot)
+
+
+def callback_query(bot, data, user_id=USER_ID, chat_id=CHAT_ID):
+    return Update.de_json(callback_query_update(data, user_id, chat_id), bot)
+
+
+def document(bot, file_id, file_name, user_id=USER_ID, chat_id=CHAT_ID):
+    return Update.de_json(document_update(file_id, file_name, user_id, chat_id), bot)
+
+
+# Test data
+# ---------
+
+def populate(amount, members):
+    """Replaces all groups with `amount` groups of `members` members in both the private and the group chat."""
+    Group.delete().execute()
+    GroupUsers.delete().execute()
+    for chat_id in (USER_ID, CHAT_ID):
+        for index in range(amount):
+            group = Group.create(user=USER_ID, chat=chat_id, name=f'group{index}')
+            GroupUsers.insert_many(
+                [{'group': group, 'alias': f'@member{index}_{number}'} for number in range(members)]).execute()
+    chat_cache.clear()
+    return group
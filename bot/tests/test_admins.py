@@ -0,0 +1,115 @@
+import pytest
+from telegram import ChatMember, Update
+from telegram.error import BadRequest
+
+from bot.settings import settings
+from bot.controllers import admins
+from bot.controllers.admins import AdminCache, get_status, chat_members_changed
+from bot.tests.fakes import FakeBot, FakeRequest, message_update, sender, USER_ID, CHAT_ID
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admins, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = AdminCache(ttl=60)
+    monkeypatch.setattr(admins, 'admin_cache', cache)
+    return cache
+
+
+# Tests
+# -----
+
+def test_statuses_expire(clock):
+    cache = AdminCache(ttl=60)
+    cache.set(CHAT_ID, USER_ID, ChatMember.CREATOR)
+    clock.now += 59
+    assert cache.get(CHAT_ID, USER_ID) == ChatMember.CREATOR
+    clock.now += 1
+    assert cache.get(CHAT_ID, USER_ID) is None
+
+
+def test_size_is_bounded():
+    cache = AdminCache(maxsize=2)
+    for user_id in (1, 2, 3):
+        cache.set(CHAT_ID, user_id, ChatMember.MEMBER)
+    cache.get(CHAT_ID, 2)
+    assert [cache.get(CHAT_ID, user_id) for user_id in (1, 2, 3)] == [None, ChatMember.MEMBER, ChatMember.MEMBER]
+
+
+def test_status_is_requested_once(cache):
+    bot = FakeBot(member_status=ChatMember.ADMINISTRATOR)
+    assert [get_status(bot, CHAT_ID, USER_ID) for _ in range(3)] == [ChatMember.ADMINISTRATOR] * 3
+    assert methods(bot) == ['getChatMember']
+
+
+def test_warm_chat_knows_members_without_requests(cache, clock, monkeypatch):
+    monkeypatch.setattr(settings, 'admin_cache_warm', True)
+    bot = FakeBot()
+    bot._request.administrators = [2]
+
+    assert get_status(bot, CHAT_ID, 2) == ChatMember.ADMINISTRATOR
+    assert [get_status(bot, CHAT_ID, user_id) for user_id in (3, 4)] == [ChatMember.MEMBER] * 2
+    assert methods(bot) == ['getChatAdministrators']
+
+    # Once the list expires, it is requested again
+    clock.now += 60
+    assert get_status(bot, CHAT_ID, 3) == ChatMember.MEMBER
+    assert methods(bot) == ['getChatAdministrators'] * 2
+
+
+def test_warm_falls_back_to_member_lookup(cache, monkeypatch):
+    monkeypatch.setattr(settings, 'admin_cache_warm', True)
+    bot = FakeBot()
+    bot._request = FailingAdministrators()
+
+    assert get_status(bot, CHAT_ID, USER_ID) == ChatMember.MEMBER
+    assert methods(bot) == ['getChatMember']  # the failed getChatAdministrators isn't recorded
+
+
+def test_joined_and_left_members_are_forgotten(cache):
+    bot = FakeBot()
+    cache.set(CHAT_ID, 2, ChatMember.LEFT)
+    cache.set(CHAT_ID, 3, ChatMember.ADMINISTRATOR)
+    cache.set(CHAT_ID, 4, ChatMember.MEMBER)
+    cache.set_administrators(CHAT_ID, [])
+
+    chat_members_changed(bot, member_update(bot, new_chat_members=[sender(2)]))
+    chat_members_changed(bot, member_update(bot, left_chat_member=sender(3)))
+
+    assert cache.get(CHAT_ID, 2) is None and cache.get(CHAT_ID, 3) is None
+    assert cache.get(CHAT_ID, 4) == ChatMember.MEMBER
+    assert cache.get(CHAT_ID, 5) is None  # the administrators list is dropped as well
+
+
+# Support Functions
+# -----------------
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FailingAdministrators(FakeRequest):
+    def post(self, url, data, timeout=None):
+        if url.endswith('/getChatAdministrators'):
+            raise BadRequest('Chat not found')
+        return super().post(url, data, timeout)
+
+
+def methods(bot):
+    return [method for _, method, _ in bot.calls]
+
+
+def member_update(bot, **members):
+    update = message_update('', USER_ID, CHAT_ID)
+    update['message'].update(members)
+    return Update.de_json(update, bot)
@@ -0,0 +1,193 @@
+import asyncio
+import json
+from email.parser import BytesParser
+
+import pytest
+from telegram import Bot, Update
+from telegram.error import BadRequest, RetryAfter
+
+from bot.aio.client import AsyncBotClient, LoopRequest
+from bot.aio.runtime import AsyncRuntime
+from bot.models import database, chat_cache, Group, GroupUsers
+from bot.outbox import Outbox
+from bot.updater import create_updater
+from bot.tests.fakes import FakeRequest, inline_query_update, message_update, populate, USER_ID, CHAT_ID
+
+TOKEN = '123456:fake-token-for-offline-tests'
+
+
+@pytest.fixture
+def db(tmpdir):
+    # The runtime uses the database from its executor threads, so it cannot be in memory
+    database.init(str(tmpdir.join('test.db')))
+    database.create_tables([Group, GroupUsers])
+    chat_cache.clear()
+    yield database
+    database.close()
+    database.init('substitute.db')
+
+
+# Tests
+# -----
+
+def test_client_parses_responses():
+    async def scenario(api):
+        client = AsyncBotClient(TOKEN, base_url=api.url)
+        assert (await client.call('getMe'))['username'] == 'fake_bot'
+        api.chunked = True
+        assert (await client.call('getMe'))['username'] == 'fake_bot'
+        api.error = 429, {'ok': False, 'description': 'Too Many Requests', 'parameters': {'retry_after': 3}}
+        with pytest.raises(RetryAfter):
+            await client.call('sendMessage', {'chat_id': CHAT_ID, 'text': 'hey'})
+        api.error = 400, {'ok': False, 'description': 'Bad Request: chat not found'}
+        with pytest.raises(BadRequest, match='Chat not found'):
+            await client.call('sendMessage', {'chat_id': CHAT_ID, 'text': 'hey'})
+        client.close()
+
+    api = run(scenario)
+    assert [method for method, _ in api.calls] == ['getMe', 'getMe', 'sendMessage', 'sendMessage']
+    assert api.connections == 1
+
+
+def test_blocking_calls_are_refused_on_the_loop():
+    async def scenario(api):
+        loop = asyncio.get_event_loop()
+        client = AsyncBotClient(TOKEN, base_url=api.url)
+        bot = Bot(TOKEN, request=LoopRequest(client, loop))
+        with pytest.raises(RuntimeError, match='event loop'):
+            bot.get_me()
+        assert (await loop.run_in_executor(None, bot.get_me)).username == 'fake_bot'
+        client.close()
+
+    api = run(scenario)
+    assert [method for method, _ in api.calls] == ['getMe']
+
+
+def test_runtime_handles_updates(db, monkeypatch):
+    populate(3, members=2)
+    updates = []
+
+    async def scenario(api):
+        loop = asyncio.get_event_loop()
+        client = AsyncBotClient(TOKEN, base_url=api.url)
+        bot = Bot(TOKEN, request=LoopRequest(client, loop))
+        runtime = AsyncRuntime(client, create_updater(bot=bot).dispatcher)
+        outbox = Outbox()
+        monkeypatch.setattr('bot.aio.runtime.outbox', outbox)
+        outbox.start()
+
+        updates.extend([
+            inline_query_update('gro', USER_ID),
+            inline_query_update('group1', USER_ID),
+            message_update('hey group2', 2, CHAT_ID),
+            message_update('/create', USER_ID, CHAT_ID),
+        ])
+        tasks = [runtime.submit(Update.de_json(update, bot)) for update in updates]
+        await asyncio.wait(tasks)
+        await loop.run_in_executor(None, outbox.stop)
+        client.close()
+
+    api = run(scenario)
+    # The first inline query got superseded by the second one
+    answers = [data for method, data in api.calls if method == 'answerInlineQuery']
+    assert [data['inline_query_id'] for data in answers] == [updates[1]['inline_query']['id']]
+    assert [result['title'] for result in answers[0]['results']] == ['Auto', 'group0', 'group1', 'group2']
+    sent = sorted(data['text'] for method, data in api.calls if method == 'sendMessage')
+    assert sent == ['Guys *group2* (@member2\\_0 @member2\\_1), you have been mentioned.',
+                    'Ok, send the name of the group. /cancel']
+
+
+def test_runtime_uploads_exported_groups(db):
+    populate(2, members=1)
+
+    async def scenario(api):
+        loop = asyncio.get_event_loop()
+        client = AsyncBotClient(TOKEN, base_url=api.url)
+        bot = Bot(TOKEN, request=LoopRequest(client, loop))
+        runtime = AsyncRuntime(client, create_updater(bot=bot).dispatcher)
+        await runtime.submit(Update.de_json(message_update('/export', USER_ID, CHAT_ID), bot))
+        client.close()
+
+    api = run(scenario)
+    [data] = [data for method, data in api.calls if method == 'sendDocument']
+    assert data['chat_id'] == str(CHAT_ID) and data['caption'].startswith('2 group(s).')
+    assert [json.loads(line)['name'] for line in data['document'].decode().splitlines()] == ['group0', 'group1']
+
+
+# Support Functions
+# -----------------
+
+class FakeApi:
+    """Bot API server on a local port, answering like FakeRequest. `error` is returned once."""
+
+    def __init__(self):
+        self.calls = []
+        self.connections = 0
+        self.chunked = False
+        self.error = None
+        self._fake = FakeRequest()
+        self._server = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        while True:
+            try:
+                request = await reader.readuntil(b'\r\n\r\n')
+            except asyncio.IncompleteReadError:
+                break
+            method = request.split()[1].decode().rsplit('/', 1)[-1]
+            length = int(request.lower().split(b'content-length:')[1].split(b'\r\n')[0])
+            content_type = request.lower().split(b'content-type:')[1].split(b'\r\n')[0].strip()
+            body = await reader.readexactly(length)
+            data = _form(content_type, body) if content_type.startswith(b'multipart/') else json.loads(body.decode())
+            self.calls.append((method, data))
+
+            status, body = 200, {'ok': True, 'result': self._fake._result(method, data)}
+            if self.error:
+                (status, body), self.error = self.error, None
+            payload = json.dumps(body).encode()
+            if self.chunked:
+                half = len(payload) // 2
+                framing = b'Transfer-Encoding: chunked\r\n\r\n'
+                payload = b''.join(b'%x\r\n%s\r\n' % (len(part), part)
+                                   for part in (payload[:half], payload[half:], b''))
+            else:
+                framing = b'Content-Length: %d\r\n\r\n' % len(payload)
+            writer.write(b'HTTP/1.1 %d OK\r\nContent-Type: application/json\r\n' % status + framing + payload)
+            await writer.drain()
+        writer.close()
+
+
+def _form(content_type, body):
+    """Fields of a multipart/form-data body, files as bytes."""
+    form = BytesParser().parsebytes(b'Content-Type: ' + content_type + b'\r\n\r\n' + body)
+    data = {}
+    for part in form.get_payload():
+        value = part.get_payload(decode=True)
+        data[part.get_param('name', header='content-disposition')] = \
+            value if part.get_filename() else value.decode()
+    return data
+
+
+def run(scenario):
+    api = FakeApi()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(api.start())
+        loop.run_until_complete(asyncio.wait_for(scenario(api), 10))
+        loop.run_until_complete(api.stop())
+    finally:
+        loop.close()
+    return api
@@ -0,0 +1,105 @@
+from telegram import Update
+
+from bot.metrics import metrics
+from bot.models import chat_cache, GroupUsers
+from bot.controllers.inlinecache import InlineCache
+from bot.controllers.notification import inline_mode, INLINE_PAGE_SIZE
+from bot.controllers.substitutegroup import substitute
+from bot.tests.fakes import FakeBot, inline_query_update, populate, USER_ID, CHAT_ID
+
+# Typing a query: (query, how the cache gets its tokens)
+TYPING = [
+    ('hey sh', 'recomputed'),
+    ('hey short', 'extended'),                   # the unfinished 'sh' is rendered again
+    ('hey short', 'cached'),
+    ('hey short, long and four', 'extended'),
+    ('hey short, long and fo', 'extended'),      # shortened
+    ('hey shirt, long and fo', 'extended'),      # edited in the middle, 'hey ' is kept
+    ('ho shirt, long and fo', 'recomputed'),     # edited in the first token, nothing is kept
+    ('', 'recomputed'),
+]
+
+
+# Tests
+# -----
+
+def test_inline_cache_matches_substitute(groups, enabled):
+    cache = InlineCache()
+    by_name = {group.name: group for group in groups}
+
+    for query, kind in TYPING:
+        before = inline_counters()
+        assert cache.substitute(USER_ID, query, groups, by_name) == substitute(query, groups), query
+        assert counted(before) == {f'inline.{kind}': 1}, query
+
+
+def test_inline_cache_is_recomputed_after_group_change(groups, enabled):
+    cache = InlineCache()
+    before = inline_counters()
+    cache.substitute(USER_ID, 'hey short', groups, {group.name: group for group in groups})
+
+    GroupUsers.create(group=next(group.id for group in groups if group.name == 'short'), alias='@carol')
+    chat_cache.invalidate(CHAT_ID)
+    fresh = chat_cache.groups(CHAT_ID)
+
+    final, _ = cache.substitute(USER_ID, 'hey short', fresh, {group.name: group for group in fresh})
+    assert final == substitute('hey short', fresh)[0] == 'hey *short* (@ann @bob\\_x @carol)'
+    assert counted(before) == {'inline.recomputed': 2}
+
+
+def test_inline_cache_is_bounded(groups):
+    cache = InlineCache(maxsize=2)
+    by_name = {group.name: group for group in groups}
+    for user_id in range(5):
+        cache.substitute(user_id, 'short', groups, by_name)
+    assert list(cache._queries) == [3, 4]
+
+
+def test_results_are_paged(db):
+    bot = FakeBot()
+    populate(INLINE_PAGE_SIZE + 11, members=1)
+
+    answer = inline_answer(bot, 'hi', 0)
+    assert answer['results'][0]['title'] == 'Auto' and len(answer['results']) == INLINE_PAGE_SIZE + 1
+    assert answer['next_offset'] == str(INLINE_PAGE_SIZE) and 'switch_pm_text' not in answer
+
+    answer = inline_answer(bot, 'hi', INLINE_PAGE_SIZE)
+    assert 'Auto' not in titles(answer) and len(answer['results']) == 11
+    assert not answer.get('next_offset') and 'switch_pm_text' not in answer
+
+    # Every group is on exactly one page
+    paged = [title for offset in (0, INLINE_PAGE_SIZE) for title in titles(inline_answer(bot, '', offset))]
+    assert sorted(paged) == sorted(f'group{index}' for index in range(INLINE_PAGE_SIZE + 11))
+
+
+def test_user_without_groups_is_offered_to_create_them(db):
+    bot = FakeBot()
+    answer = inline_answer(bot, 'hi', 0)
+    assert answer['results'] == [] and answer['switch_pm_text'] == 'Create own groups'
+
+    # Only on the first page
+    answer = inline_answer(bot, 'hi', INLINE_PAGE_SIZE)
+    assert answer['results'] == [] and not answer.get('next_offset') and 'switch_pm_text' not in answer
+
+
+# Support Functions
+# -----------------
+
+def inline_answer(bot, query, offset):
+    """The answerInlineQuery request, that inline_mode sends for the query."""
+    inline_mode(bot, Update.de_json(inline_query_update(query, USER_ID, str(offset or '')), bot))
+    return bot.calls[-1][2]
+
+
+def titles(answer):
+    return [result['title'] for result in answer['results']]
+
+
+def inline_counters():
+    return {name: value for name, value in metrics.snapshot()['counters'].items() if name.startswith('inline.')}
+
+
+def counted(before):
+    """The inline.* counters, that grew since `before`, with how much they grew."""
+    return {name: value - before.get(name, 0) for name, value in inline_counters().items()
+            if value != before.get(name, 0)}
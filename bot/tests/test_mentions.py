@@ -0,0 +1,39 @@
+import pytest
+
+from bot.models import chat_cache, Group
+from bot.controllers import mentions
+from bot.controllers.mentions import MentionMatcher
+from bot.tests.fakes import CHAT_ID
+
+
+# Tests
+# -----
+
+@pytest.mark.parametrize('names, text, found', [
+    (['ab', 'b', 'abc'], 'xabcx', {'ab', 'b', 'abc'}),  # nested, all of them end inside each other
+    (['ab', 'b', 'abc'], 'ab', {'ab', 'b'}),
+    (['ab', 'b', 'abc'], 'acb', {'b'}),
+    (['she', 'he', 'hers'], 'ushers', {'she', 'he', 'hers'}),  # 'hers' is reached over the suffix link of 'she'
+    (['abd', 'bc'], 'abc', {'bc'}),  # fails from 'ab' over to 'b'
+    (['aa'], 'aaa', {'aa'}),  # overlapping occurrences
+    (['group', ''], 'no mentions', set()),
+    ([], 'anything', set()),
+])
+def test_matcher(names, text, found):
+    assert MentionMatcher(names).find(text) == found
+
+
+def test_matcher_of_empty_chat(db):
+    assert mentions.find(CHAT_ID, 'short and long') == set()
+
+
+def test_matcher_is_rebuilt_with_chat_groups(groups):
+    assert mentions.find(CHAT_ID, 'hey short and long') == {'short', 'long'}
+
+    Group.update(name='tall').where(Group.name == 'long').execute()
+    chat_cache.invalidate(CHAT_ID)
+    assert mentions.find(CHAT_ID, 'hey short and long, tall') == {'short', 'tall'}
+
+    Group.delete().where(Group.name == 'short').execute()
+    chat_cache.invalidate(CHAT_ID)
+    assert mentions.find(CHAT_ID, 'hey short and long, tall') == {'tall'}
@@ -0,0 +1,72 @@
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from bot.metrics import metrics, prometheus, instrument_bot, instrument_database, MetricsServer
+from bot.models import chat_groups
+from bot.tests.fakes import FakeBot, populate, CHAT_ID
+
+
+# Tests
+# -----
+
+def test_nothing_is_recorded_while_disabled():
+    metrics.clear()
+    metrics.count('inline.cached')
+    metrics.gauge('queue.message', 1)
+    metrics.observe('handler.inline_mode', 0.1)
+    assert metrics.snapshot() == {'counters': {}, 'gauges': {}, 'timings': {}}
+
+
+def test_latency_histogram(enabled):
+    for seconds in (0.0002, 0.003, 0.003, 20):
+        metrics.observe('handler.inline_mode', seconds)
+
+    timing = metrics.snapshot()['timings']['handler.inline_mode']
+    buckets = dict(timing['buckets'])
+    assert timing['count'] == 4 and timing['max'] == 20
+    assert (buckets[0.0001], buckets[0.00025], buckets[0.005], buckets[10], buckets[float('inf')]) == (0, 1, 3, 3, 4)
+
+
+def test_prometheus_format(enabled):
+    metrics.count('inline.cached', 2)
+    metrics.gauge('queue.message', 3)
+    metrics.observe('handler.inline_mode', 0.003)
+
+    lines = prometheus(metrics.snapshot()).splitlines()
+    assert '# TYPE substitute_inline_total counter' in lines
+    assert 'substitute_inline_total{name="cached"} 2' in lines
+    assert 'substitute_queue{name="message"} 3' in lines
+    assert '# TYPE substitute_handler_seconds histogram' in lines
+    assert 'substitute_handler_seconds_bucket{name="inline_mode",le="0.0025"} 0' in lines
+    assert 'substitute_handler_seconds_bucket{name="inline_mode",le="+Inf"} 1' in lines
+    assert 'substitute_handler_seconds_count{name="inline_mode"} 1' in lines
+
+
+def test_database_and_api_are_instrumented(db, enabled, monkeypatch):
+    populate(2, members=1)
+    monkeypatch.setattr(db, 'execute_sql', db.execute_sql)
+    instrument_database(db)
+    bot = FakeBot()
+    instrument_bot(bot)
+
+    chat_groups(CHAT_ID)
+    bot.send_message(CHAT_ID, 'text')
+
+    timings = metrics.snapshot()['timings']
+    assert timings['db.select']['count'] == 2
+    assert timings['api.sendMessage']['count'] == 1
+
+
+def test_metrics_endpoint(enabled):
+    metrics.count('inline.cached')
+    server = MetricsServer(port=9187)
+    server.start()
+    try:
+        body = urlopen('http://127.0.0.1:9187/metrics').read().decode()
+        assert 'substitute_inline_total{name="cached"} 1' in body
+        with pytest.raises(HTTPError):
+            urlopen('http://127.0.0.1:9187/')
+    finally:
+        server.stop()
@@ -0,0 +1,118 @@
+from telegram.error import BadRequest, TimedOut
+
+from bot.outbox import Outbox
+from bot.tests.fakes import FakeBot, FakeRequest, populate, message, CHAT_ID
+from bot.controllers.notification import check_every_message
+
+
+# Tests
+# -----
+
+def test_mentions_are_merged_into_one_reply(db):
+    bot = FakeBot()
+    populate(3, members=2)
+
+    check_every_message(bot, message(bot, 'hey group0 and group2, also group0', user_id=2))
+
+    sent = [data for _, method, data in bot.calls if method == 'sendMessage']
+    assert len(sent) == 1
+    assert sent[0]['text'] == 'Guys *group0* (@member0\\_0 @member0\\_1), *group2* (@member2\\_0 @member2\\_1), ' \
+                              'you have been mentioned.'
+    assert 'reply_to_message_id' in sent[0]
+
+
+def test_messages_are_sent_within_chat_limit():
+    bot = FakeBot()
+    outbox = Outbox(global_limit=1000, chat_limit=5, chat_period=0.5)
+    outbox.start()
+    for index in range(10):
+        outbox.send(bot, CHAT_ID, f'first {index}')
+        outbox.send(bot, CHAT_ID - 1, f'second {index}')
+    outbox.stop()
+
+    for chat_id in (CHAT_ID, CHAT_ID - 1):
+        sent = [time for time, _, data in bot.calls if data['chat_id'] == chat_id]
+        assert len(sent) == 10
+        assert sent[5] - sent[0] >= 0.5
+    # Chats take turns, instead of waiting for each other
+    assert [data['chat_id'] for _, _, data in bot.calls[:4]] == [CHAT_ID, CHAT_ID - 1] * 2
+
+
+def test_messages_are_sent_within_global_limit():
+    bot = FakeBot()
+    outbox = Outbox(global_limit=10, chat_limit=1000)
+    outbox.start()
+    for index in range(15):
+        outbox.send(bot, CHAT_ID - index, 'message')
+    outbox.stop()
+
+    sent = [time for time, _, _ in bot.calls]
+    assert len(sent) == 15
+    assert sent[10] - sent[0] >= 1
+
+
+def test_flood_control_pauses_sending():
+    bot = FakeBot(flood_limit=3, flood_period=0.3)
+    outbox = Outbox(global_limit=1000, chat_limit=1000)
+    outbox.start()
+    for index in range(7):
+        outbox.send(bot, CHAT_ID, str(index))
+    outbox.stop()
+
+    assert bot._request.flooded
+    assert [data['text'] for _, _, data in bot.calls] == [str(index) for index in range(7)]
+
+
+def test_network_errors_are_retried():
+    bot = FakeBot()
+    bot._request = FailingRequest(failures=2)
+    outbox = Outbox(global_limit=1000, chat_limit=1000, backoff=0.01)
+    outbox.start()
+    outbox.send(bot, CHAT_ID, 'message')
+    outbox.stop()
+
+    assert [data['text'] for _, _, data in bot.calls] == ['message']
+
+
+def test_bad_requests_are_not_retried():
+    bot = FakeBot()
+    bot._request = FailingRequest(failures=1, error=BadRequest("Can't parse entities"))
+    outbox = Outbox(global_limit=1000, chat_limit=1000, backoff=10)
+    outbox.start()
+    outbox.send(bot, CHAT_ID, 'broken *markdown')
+    outbox.send(bot, CHAT_ID, 'next')
+    outbox.stop(timeout=5)
+
+    # Neither retried nor holding up the rest of the chat with a backoff
+    assert bot._request.attempts == 2
+    assert [data['text'] for _, _, data in bot.calls] == ['next']
+
+
+def test_message_is_dropped_after_retries():
+    bot = FakeBot()
+    bot._request = FailingRequest(failures=10)
+    outbox = Outbox(global_limit=1000, chat_limit=1000, retries=2, backoff=0.01)
+    outbox.start()
+    outbox.send(bot, CHAT_ID, 'message')
+    outbox.send(bot, CHAT_ID - 1, 'message')
+    outbox.stop(timeout=5)
+
+    assert not bot.calls
+    assert bot._request.attempts == 6
+
+
+# Support Functions
+# -----------------
+
+class FailingRequest(FakeRequest):
+    def __init__(self, failures, error=None):
+        super().__init__()
+        self.failures = failures
+        self.error = error or TimedOut()
+        self.attempts = 0
+
+    def post(self, url, data, timeout=None):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise self.error
+        return super().post(url, data, timeout)
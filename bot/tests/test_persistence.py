@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from bot.models import Group, Conversation, UserData
+from bot.persistence import MemoryPersistence, DatabasePersistence
+from bot.updater import create_updater
+from bot.tests.fakes import FakeBot, populate, message, callback_query, USER_ID
+
+
+# Tests
+# -----
+
+@pytest.mark.parametrize('kind', [MemoryPersistence, DatabasePersistence])
+def test_conversation_survives_restart(db, kind):
+    db.create_tables([Conversation, UserData])
+    group = populate(1, members=1)  # a group of the private chat
+    persistence = kind()
+
+    bot, dispatcher = start(persistence)
+    dispatcher.process_update(callback_query(bot, f'group.list.{group.id}', chat_id=USER_ID))
+    dispatcher.process_update(callback_query(bot, f'group.rename.{group.id}', chat_id=USER_ID))
+    persistence.stop()
+
+    bot, dispatcher = start(persistence)
+    dispatcher.process_update(message(bot, 'renamed', chat_id=USER_ID))
+    assert Group.get_by_id(group.id).name == 'renamed'
+    assert [data['text'] for _, method, data in bot.calls if method == 'sendMessage'][0] == 'Saved.'
+
+    # The finished conversation is gone from the storage too
+    persistence.stop()
+    conversations, user_data = persistence.load()
+    assert not any(conversations.values())
+    assert user_data == {USER_ID: {'effective_group': group.id}}
+
+
+def test_conversation_continues_in_another_process(db):
+    db.create_tables([Conversation, UserData])
+    group = populate(1, members=1)
+    first, second = DatabasePersistence(), DatabasePersistence(interval=0.2)
+    bot, dispatcher = start(first)
+    other_bot, other = start(second)  # both are running before the conversation starts
+
+    dispatcher.process_update(callback_query(bot, f'group.list.{group.id}', chat_id=USER_ID))
+    dispatcher.process_update(callback_query(bot, f'group.rename.{group.id}', chat_id=USER_ID))
+    other.process_update(message(other_bot, 'too early', chat_id=USER_ID))  # nothing is flushed yet
+    first.flush()
+
+    # Until the miss expires, the other process doesn't look again
+    other.process_update(message(other_bot, 'still early', chat_id=USER_ID))
+    assert Group.get_by_id(group.id).name == 'group0'
+
+    time.sleep(0.2)
+    other.process_update(message(other_bot, 'renamed', chat_id=USER_ID))
+    assert Group.get_by_id(group.id).name == 'renamed'
+    assert [data['text'] for _, method, data in other_bot.calls if method == 'sendMessage'][0] == 'Saved.'
+    first.stop()
+    second.stop()
+
+
+def test_changes_are_written_in_batches():
+    persistence = MemoryPersistence(threshold=3)
+    persistence.update_conversation('create', (1, 1), 0)
+    persistence.update_user_data(1, {'tries': 3})
+    persistence.update_user_data(1, {'tries': 3})  # unchanged, nothing to write
+    assert persistence.load() == ({}, {})
+
+    persistence.update_conversation('create', (2, 2), 0)
+    assert persistence.load() == ({'create': {(1, 1): 0, (2, 2): 0}}, {1: {'tries': 3}})
+
+
+# Support Functions
+# -----------------
+
+def start(persistence):
+    bot = FakeBot()
+    dispatcher = create_updater(bot=bot).dispatcher
+    persistence.attach(dispatcher)
+    persistence.start()
+    return bot, dispatcher
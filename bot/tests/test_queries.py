@@ -0,0 +1,198 @@
+import json
+
+import pytest
+from telegram.ext import ConversationHandler
+
+from bot.metrics import iter_handlers
+from bot.models import chat_cache, load_group, GroupUsers
+from bot.settings import settings
+from bot.updater import create_updater
+from bot.controllers.groups import GROUP_ADD_MEMBERS
+from bot.controllers.groups import group_list, group_open, group_join, group_leave, group_remove_enter, group_add_members
+from bot.controllers.groups import group_create
+from bot.controllers.groups import group_remove_members, group_delete_complete, group_copy_complete, group_export
+from bot.controllers.groups import group_create_complete, group_exit, group_add_members_enter, \
+    group_add_members_complete, group_remove_exit, group_rename_enter, group_rename_complete, group_delete_enter, \
+    group_copy_enter, group_import_complete
+from bot.controllers.notification import inline_mode, check_every_message
+from bot.tests.fakes import FakeBot, populate, message, inline_query, callback_query, document, CHAT_ID
+
+
+# Tests
+# -----
+
+HANDLERS = {
+    'inline_mode': lambda bot, group: inline_mode(bot, inline_query(bot, f'hi {group.name} there')),
+    'check_every_message': lambda bot, group: check_every_message(bot, message(bot, f'hey {group.name}', user_id=2)),
+    'group_list': lambda bot, group: group_list(bot, message(bot, '/groups')),
+    'group_open': lambda bot, group: group_open(bot, callback_query(bot, f'group.list.{group.id}'), {}),
+    'group_join': lambda bot, group: group_join(bot, callback_query(bot, f'group.join.{group.id}')),
+    'group_leave': lambda bot, group: group_leave(bot, callback_query(bot, f'group.leave.{group.id}')),
+    'group_remove_enter': lambda bot, group: group_remove_enter(bot, callback_query(bot, f'group.remove.{group.id}'), {}),
+}
+
+# Handlers, whose queries must be served by indexes. The same handler with other input is a separate entry,
+# named `handler (case)`.
+PLANS = {
+    **HANDLERS,
+    'group_create': lambda bot, group: group_create(bot, message(bot, '/create')),
+    'group_create_complete': lambda bot, group: group_create_complete(bot, message(bot, 'newgroup')),
+    'group_exit': lambda bot, group: group_exit(bot, callback_query(bot, 'group.exit')),
+    'group_add_members_enter': lambda bot, group: group_add_members_enter(
+        bot, callback_query(bot, f'group.add.{group.id}'), {}),
+    'group_add_members': lambda bot, group: group_add_members(
+        bot, message(bot, '@new_one'), {'effective_group': group.id, 'tries': 3}),
+    'group_add_members (bulk)': lambda bot, group: group_add_members(
+        bot, message(bot, 'one two'), {'effective_group': group.id, 'tries': 3}),
+    'group_add_members_complete': lambda bot, group: group_add_members_complete(
+        bot, message(bot, '/done'), {'effective_group': group.id}),
+    'group_remove_members': lambda bot, group: group_remove_members(
+        bot, callback_query(bot, f'group.remove_members.{group.members[0].id}'), {'effective_group': group.id}),
+    'group_remove_exit': lambda bot, group: group_remove_exit(
+        bot, callback_query(bot, 'group.remove.exit'), {'effective_group': group.id}),
+    'group_rename_enter': lambda bot, group: group_rename_enter(
+        bot, callback_query(bot, f'group.rename.{group.id}'), {}),
+    'group_rename_complete': lambda bot, group: group_rename_complete(
+        bot, message(bot, 'renamed'), {'effective_group': group.id}),
+    'group_delete_enter': lambda bot, group: group_delete_enter(
+        bot, callback_query(bot, f'group.delete.{group.id}'), {}),
+    'group_delete_complete': lambda bot, group: group_delete_complete(
+        bot, callback_query(bot, 'group.delete.yes'), {'effective_group': group.id}),
+    'group_copy_enter': lambda bot, group: group_copy_enter(bot, callback_query(bot, f'group.copy.{group.id}'), {}),
+    'group_copy_complete': lambda bot, group: group_copy_complete(
+        bot, callback_query(bot, 'group.copy.yes'), {'effective_group': group.id, 'overwrite': True}),
+    'group_export': lambda bot, group: group_export(bot, message(bot, '/export'), []),
+    'group_import_complete': lambda bot, group: group_import_complete(bot, imported(bot, group)),
+}
+
+# Registered handlers, that don't touch the database
+WITHOUT_QUERIES = {'start', 'help', 'cancel', 'expired_session', 'inline_chosen', 'chat_members_changed',
+                   'group_import_enter'}
+
+
+@pytest.mark.parametrize('handler', sorted(HANDLERS))
+def test_query_count_does_not_depend_on_groups(db, queries, handler):
+    bot = FakeBot()
+
+    executed = []
+    for amount in (1, 25):
+        group = populate(amount, members=5)
+        chat_cache.clear()
+        del queries[:]
+        HANDLERS[handler](bot, group)
+        executed.append(len(queries))
+
+    assert executed[0] == executed[1], f'{handler} issues queries per group'
+
+
+@pytest.mark.parametrize('handler', sorted(PLANS))
+def test_queries_do_not_scan_tables(db, plans, handler):
+    bot = FakeBot()
+    group = load_group(populate(25, members=5).id)
+    chat_cache.clear()  # explain the queries of a cache miss
+
+    del plans[:]
+    PLANS[handler](bot, group)
+
+    assert plans, f'{handler} issues no queries to check'
+    scans = [(sql, detail) for sql, details in plans for detail in details
+             if detail.startswith('SCAN') and not detail.endswith('CONSTANT ROWS')]  # but the VALUES of an INSERT
+    assert not scans, f'{handler} scans a whole table'
+
+
+def test_every_registered_handler_has_its_plans_checked():
+    dispatcher = create_updater(bot=FakeBot()).dispatcher
+    registered = {handler.callback.__name__ for group in dispatcher.groups
+                  for handler in iter_handlers(dispatcher.handlers[group])}
+    checked = {name.split()[0] for name in PLANS}
+    assert registered - WITHOUT_QUERIES == checked
+
+
+def test_steady_state_traffic_is_served_from_cache(db, queries):
+    bot = FakeBot()
+    group = populate(10, members=5)
+    HANDLERS['check_every_message'](bot, group)
+    HANDLERS['inline_mode'](bot, group)
+
+    del queries[:]
+    for _ in range(3):
+        HANDLERS['check_every_message'](bot, group)
+        HANDLERS['inline_mode'](bot, group)
+    assert not queries
+
+
+# Support Functions
+# -----------------
+
+def imported(bot, group):
+    """A document update with an export of the group, that adds a member to it."""
+    bot._request.files['export'] = json.dumps({'chat': group.chat, 'user': group.user, 'name': group.name,
+                                               'members': [member.alias for member in group.members] + ['@imported']})\
+        .encode()
+    return document(bot, 'export', 'groups.jsonl')
+
+
+def test_cached_groups_share_aliases(db):
+    populate(2, members=1)
+    GroupUsers.update(alias='@same_name').execute()
+
+    first, second = chat_cache.groups(CHAT_ID)
+    assert first.members[0].alias is second.members[0].alias
+    assert first.members_string == '@same\\_name'
+    assert not hasattr(first, '__dict__')
+
+
+def test_bulk_add_members_uses_one_insert(db, queries):
+    bot = FakeBot()
+    group = populate(1, members=1)
+
+    del queries[:]
+    state = group_add_members(bot, message(bot, '@member0_0, new_one @new_two\nbad!name new_one'),
+                              {'effective_group': group.id, 'tries': 3})
+
+    assert state == GROUP_ADD_MEMBERS
+    assert sum(sql.startswith('INSERT') for sql in queries) == 1
+    assert [member.alias for member in chat_cache.groups(CHAT_ID)[0].members] == ['@member0_0', '@new_one', '@new_two']
+    assert [data['text'] for _, method, data in bot.calls if method == 'sendMessage'] == [
+        'Added: `@new\\_one` `@new\\_two`\n'
+        'Already in the group: `@member0\\_0` `@new\\_one`\n'
+        'Invalid: `bad!name`']
+
+
+def test_bulk_add_members_respects_limit(db, monkeypatch):
+    monkeypatch.setattr(settings, 'group_members_limit', 3)
+    bot = FakeBot()
+    group = populate(1, members=1)
+
+    state = group_add_members(bot, message(bot, 'one two three'), {'effective_group': group.id, 'tries': 3})
+
+    assert state == ConversationHandler.END
+    assert len(chat_cache.groups(CHAT_ID)[0].members) == 3
+    assert bot.calls[0][2]['text'].endswith('Not added, the group is limited to 3: `@three`')
+
+
+def test_create_counts_groups_without_loading_them(db, queries, monkeypatch):
+    monkeypatch.setattr(settings, 'group_limit', 3)
+    bot = FakeBot()
+    populate(4, members=5)
+
+    del queries[:]
+    assert group_create(bot, message(bot, '/create')) == ConversationHandler.END
+    assert len(queries) == 1 and queries[0].startswith('SELECT COUNT(1)')
+
+    # Cached groups are counted without a query
+    chat_cache.groups(CHAT_ID)
+    del queries[:]
+    assert group_create(bot, message(bot, '/create')) == ConversationHandler.END
+    assert not queries
+
+
+# Support Functions
+# -----------------
+
+def imported(bot, group):
+    """A document update with an export of the group, that adds a member to it."""
+    bot._request.files['export'] = json.dumps({'chat': group.chat, 'user': group.user, 'name': group.name,
+                                               'members': [member.alias for member in group.members] + ['@imported']})\
+        .encode()
+    return document(bot, 'export', 'groups.jsonl')
@@ -0,0 +1,57 @@
+import os
+
+from bot.settings import Settings, SettingsWatcher
+
+
+# Tests
+# -----
+
+def test_defaults(tmpdir):
+    settings = Settings.load(write(tmpdir, 'TOKEN=123:abc'))
+    assert settings.token == '123:abc'
+    assert (settings.group_limit, settings.group_members_limit) == (20, 30)
+    assert settings.log_file == 'substitute.log'
+
+
+def test_only_reloadable_settings_are_reloaded(tmpdir):
+    path = write(tmpdir, 'TOKEN=123:abc\nGROUP_LIMIT=5\nWORKERS=2')
+    settings = Settings.load(path)
+
+    write(tmpdir, 'TOKEN=456:def\nGROUP_LIMIT=7\nGROUP_MEMBERS_LIMIT=3\nWORKERS=4')
+    assert sorted(settings.reload()) == ['group_limit', 'group_members_limit']
+    assert (settings.group_limit, settings.group_members_limit) == (7, 3)
+    assert (settings.token, settings.workers) == ('123:abc', 2)
+
+
+def test_watcher_reloads_modified_file(tmpdir):
+    path = write(tmpdir, 'GROUP_LIMIT=5')
+    settings = Settings.load(path)
+    watcher = SettingsWatcher(settings)
+
+    watcher.check()
+    assert settings.group_limit == 5
+
+    write(tmpdir, 'GROUP_LIMIT=9')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    watcher.check()
+    assert settings.group_limit == 9
+
+
+def test_watcher_keeps_settings_on_broken_file(tmpdir):
+    path = write(tmpdir, 'GROUP_LIMIT=5')
+    settings = Settings.load(path)
+    watcher = SettingsWatcher(settings)
+
+    write(tmpdir, 'GROUP_LIMIT=many')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    watcher.check()
+    assert settings.group_limit == 5
+
+
+# Support Functions
+# -----------------
+
+def write(tmpdir, content):
+    path = tmpdir.join('config.env')
+    path.write(content)
+    return str(path)
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+from playhouse.migrate import SchemaMigrator
+
+from bot.models import database, chat_cache, Group, GroupUsers, Conversation, UserData
+from bot.models.cache import ChatCache
+from bot.models.migrations import MIGRATIONS, SchemaVersion, migrate
+from bot.models.storage import CallbackSqliteDatabase, create_database
+from bot.settings import Settings
+from bot.tests.fakes import populate, CHAT_ID
+
+
+@pytest.fixture
+def empty_db(tmpdir):
+    database.init(str(tmpdir.join('test.db')))
+    chat_cache.clear()
+    yield database
+    database.close()
+    database.init('substitute.db')
+
+
+# Tests
+# -----
+
+def test_database_is_selected_from_settings(tmpdir):
+    sqlite = create_database(settings(tmpdir, 'DATABASE=bot.db'))
+    assert isinstance(sqlite, CallbackSqliteDatabase) and sqlite.database == 'bot.db'
+    assert create_database(settings(tmpdir, 'DATABASE=sqlite:////var/lib/bot.db')).database == '/var/lib/bot.db'
+
+    postgresql = create_database(settings(tmpdir, 'DATABASE=postgresql://bot:p%40ss@db:5433/substitute\n'
+                                                  'DATABASE_POOL_SIZE=4'))
+    assert postgresql.database == 'substitute'
+    assert postgresql.connect_params == {'user': 'bot', 'password': 'p@ss', 'host': 'db', 'port': 5433}
+    assert postgresql._max_connections == 4
+    assert callable(postgresql.after_transaction)
+
+    with pytest.raises(ValueError):
+        create_database(settings(tmpdir, 'DATABASE=mysql://db/substitute'))
+
+
+def test_migrations_are_applied_once(empty_db):
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert migrate() == versions
+    assert migrate() == []
+    assert [row.version for row in SchemaVersion.select()] == versions
+    assert database.table_exists('group') and database.table_exists('groupusers')
+
+
+def test_migrations_give_the_schema_of_the_models(empty_db, tmpdir):
+    migrate()
+    migrated = schema()
+
+    database.close()
+    database.init(str(tmpdir.join('models.db')))
+    database.create_tables([Group, GroupUsers, Conversation, UserData])
+    assert migrated == schema()
+
+
+def test_initial_migration_creates_the_old_member_index(empty_db):
+    _, _, initial = MIGRATIONS[0]
+    initial(SchemaMigrator.from_database(database))
+    assert sorted(index.name for index in database.get_indexes('groupusers')) == [
+        'groupusers_group_id', 'groupusers_group_id_alias']
+
+
+def test_existing_database_is_adopted(empty_db):
+    database.create_tables([Group, GroupUsers])
+    populate(2, members=1)
+
+    assert migrate()
+    assert Group.select().count() == 4
+
+
+def test_redundant_member_index_is_dropped(empty_db):
+    database.create_tables([Group, GroupUsers])
+    database.execute_sql('CREATE INDEX "groupusers_group_id" ON "groupusers" ("group_id")')
+
+    migrate()
+    assert [index.name for index in database.get_indexes('groupusers')] == ['groupusers_group_id_alias']
+
+
+def test_cache_expires_changes_of_other_processes(empty_db):
+    migrate()
+    populate(1, members=1)
+    cache = ChatCache(ttl=0.1)
+    assert [group.name for group in cache.groups(CHAT_ID)] == ['group0']
+
+    # Written by another process, which cannot invalidate this cache
+    Group.create(user=1, chat=CHAT_ID, name='group1')
+    assert cache.cached(CHAT_ID) and len(cache.groups(CHAT_ID)) == 1
+
+    time.sleep(0.15)
+    assert not cache.cached(CHAT_ID)
+    assert [group.name for group in cache.groups(CHAT_ID)] == ['group0', 'group1']
+
+
+# Support Functions
+# -----------------
+
+def settings(tmpdir, content):
+    path = tmpdir.join('config.env')
+    path.write(content)
+    return Settings.load(str(path))
+
+
+def schema():
+    """Columns and indexes of the tables of the models in the database."""
+    return {model._meta.table_name: (
+        [(column.name, column.data_type, column.null, column.primary_key)
+         for column in database.get_columns(model._meta.table_name)],
+        sorted((index.name, index.columns, index.unique) for index in database.get_indexes(model._meta.table_name)))
+        for model in (Group, GroupUsers, Conversation, UserData)}
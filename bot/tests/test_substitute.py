@@ -0,0 +1,30 @@
+import pytest
+
+from bot.controllers.substitutegroup import substitute
+
+LONG = '*long* (@user\\_0 @user\\_1 @user\\_2 @user\\_3 @user\\_4)'
+
+# (message, final, draft) with the GROUPS of conftest.py, as rendered by the word by word substitution
+# before the single pass one
+CASES = [
+    ('', '', ''),
+    ('nothing here', 'nothing here', 'nothing here'),
+    ('hey short, how are you?', 'hey *short* (@ann @bob\\_x), how are you?', 'hey *short* (...), how are you?'),
+    ('  short  ', '  *short* (@ann @bob\\_x)  ', '  *short* (...)  '),
+    ('ping long', f'ping *long*\n\n{LONG}', 'ping *long* (...)'),
+    ('four long long', f'*four* (@a1 @a2 @a3 @a4) *long* *long*\n\n{LONG} {LONG}', '*four* (...) *long* *long* (...)'),
+    ('long...and short!!', f'*long*...and *short* (@ann @bob\\_x)!!\n\n{LONG}', '*long*...and *short* (...)!! (...)'),
+    ('short-long—empty??!', f'*short* (@ann @bob\\_x)-*long*—*empty*??!\n\n{LONG}', '*short* (...)-*long*—*empty*??! (...)'),
+    ('шорт и long, empty', f'*short* (@ann @bob\\_x) и *long*, *empty*\n\n{LONG}', '*short* (...) и *long*, *empty* (...)'),
+    ('Short SHORT shорт', 'Short SHORT *short* (@ann @bob\\_x)', 'Short SHORT *short* (...)'),
+    ('лонг, four?! 😀 short', f'*лонг*, *four* (@a1 @a2 @a3 @a4)?! 😀 *short* (@ann @bob\\_x)\n\n{LONG}',
+     '*лонг*, *four* (...)?! 😀 *short* (...) (...)'),
+]
+
+
+# Tests
+# -----
+
+@pytest.mark.parametrize('message, final, draft', CASES)
+def test_substitute(groups, message, final, draft):
+    assert substitute(message, groups) == (final, draft)
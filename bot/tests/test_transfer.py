@@ -0,0 +1,83 @@
+import io
+import json
+
+import pytest
+
+from bot.models import Group, GroupUsers
+from bot.models.transfer import export_groups, import_groups, read, write
+from bot.controllers.groups import group_export, group_import_complete
+from bot.tests.fakes import FakeBot, populate, message, document, CHAT_ID
+
+
+# Tests
+# -----
+
+@pytest.mark.parametrize('format', ['jsonl', 'csv'])
+def test_export_import_round_trip(db, format):
+    populate(5, members=3)
+    file = io.StringIO(newline='')
+    assert write(export_groups(chunk=2), file, format) == 10
+    exported = list(export_groups())
+
+    GroupUsers.delete().execute()
+    Group.delete().execute()
+    file.seek(0)
+    assert import_groups(read(file, format), chunk=3) == (10, 30)
+    assert strip(export_groups()) == strip(exported)
+
+    # Importing again only merges, nothing is added twice
+    file.seek(0)
+    assert import_groups(read(file, format)) == (0, 0)
+
+
+def test_malformed_line_is_reported():
+    with pytest.raises(ValueError, match='Line 2'):
+        list(read(io.StringIO('{"chat": 1, "user": 1, "name": "a", "members": []}\n{"chat": "x"}\n')))
+
+
+def test_export_command_sends_chat_groups(db):
+    bot = FakeBot()
+    populate(2, members=1)
+
+    group_export(bot, message(bot, '/export'), [])
+    data = [data for _, method, data in bot.calls if method == 'sendDocument'][0]
+    lines = [json.loads(line) for line in data['document'].getvalue().decode().splitlines()]
+    assert [(line['chat'], line['name'], line['members']) for line in lines] == \
+           [(CHAT_ID, 'group0', ['@member0_0']), (CHAT_ID, 'group1', ['@member1_0'])]
+
+
+def test_import_command_adds_groups_to_chat(db):
+    bot = FakeBot()
+    populate(1, members=1)
+    bot._request.files['f1'] = '\n'.join(json.dumps(group) for group in [
+        {'chat': 5, 'user': 5, 'name': 'group0', 'members': ['@member0_0', '@new_one']},
+        {'chat': 5, 'user': 5, 'name': 'Friends', 'members': ['@a_friend', 'no_at', '@a_friend']},
+        {'chat': 5, 'user': 5, 'name': 'bad name', 'members': []},
+    ]).encode()
+
+    group_import_complete(bot, document(bot, 'f1', 'groups.jsonl'))
+    assert bot.calls[-1][2]['text'] == 'Imported 1 group(s) and 2 member(s). Skipped bad name: invalid names ' \
+                                       'or over the limit.'
+    groups = {group['name']: group['members'] for group in export_groups(CHAT_ID)}
+    assert groups == {'group0': ['@member0_0', '@new_one'], 'friends': ['@a_friend']}
+
+
+def test_broken_file_imports_nothing(db):
+    bot = FakeBot()
+    # More than one chunk of import_groups, so that the first one would already be written
+    lines = [json.dumps({'chat': 5, 'user': 5, 'name': 'friends', 'members': [f'@friend_{index}']})
+             for index in range(205)]
+    lines[203] = '{"chat": 5'
+    bot._request.files['f1'] = '\n'.join(lines).encode()
+
+    group_import_complete(bot, document(bot, 'f1', 'groups.jsonl'))
+    assert bot.calls[-1][2]['text'].startswith('Sorry, the file could not be read. Line 204')
+    assert not Group.select().count() and not GroupUsers.select().count()
+
+
+# Support Functions
+# -----------------
+
+def strip(groups):
+    return [(group['chat'], group['user'], group['name'], group['usage'], group['members']) for group in groups]
+
@@ -0,0 +1,101 @@
+from peewee import OperationalError
+
+from bot.models import database, chat_cache, Group
+from bot.models import usage
+from bot.models.usage import UsageCounter
+from bot.controllers import notification
+from bot.tests.fakes import FakeBot, populate, inline_query, USER_ID, CHAT_ID
+
+
+# Tests
+# -----
+
+def test_increments_are_coalesced(db, queries):
+    group = populate(2, members=1)
+    counter = UsageCounter(threshold=100)
+    del queries[:]
+    for _ in range(3):
+        counter.increment(group.id, CHAT_ID)
+
+    assert not queries and counter.pending(group.id) == 3
+    counter.flush()
+    assert [sql.split()[0] for sql in queries] == ['UPDATE']
+    assert usages() == {'group0': 0, 'group1': 3}
+    assert counter.pending(group.id) == 0
+
+
+def test_threshold_flushes(db):
+    group = populate(1, members=1)
+    counter = UsageCounter(threshold=3)
+    counter.increment(group.id, CHAT_ID)
+    counter.increment(group.id, CHAT_ID)
+    assert usages() == {'group0': 0}
+    counter.increment(group.id, CHAT_ID)
+    assert usages() == {'group0': 3}
+
+
+def test_flush_is_chunked(db, queries, monkeypatch):
+    monkeypatch.setattr(usage, 'FLUSH_CHUNK', 2)
+    populate(5, members=1)
+    counter = UsageCounter()
+    for amount, group in enumerate(Group.select().where(Group.chat == CHAT_ID).order_by(Group.name), 1):
+        counter.increment(group.id, CHAT_ID, amount)
+
+    del queries[:]
+    counter.flush()
+    assert [sql.split()[0] for sql in queries] == ['UPDATE'] * 3
+    assert usages() == {'group0': 1, 'group1': 2, 'group2': 3, 'group3': 4, 'group4': 5}
+
+
+def test_failed_flush_is_requeued(db, monkeypatch):
+    group = populate(1, members=1)
+    counter = UsageCounter()
+    counter.increment(group.id, CHAT_ID, 2)
+
+    execute_sql = database.execute_sql
+
+    def failing(sql, *args, **kwargs):
+        if sql.startswith('UPDATE'):
+            raise OperationalError('database is locked')
+        return execute_sql(sql, *args, **kwargs)
+
+    monkeypatch.setattr(database, 'execute_sql', failing)
+    counter.flush()
+    assert counter.pending(group.id) == 2 and usages() == {'group0': 0}
+
+    monkeypatch.setattr(database, 'execute_sql', execute_sql)
+    counter.increment(group.id, CHAT_ID)
+    counter.flush()
+    assert counter.pending(group.id) == 0 and usages() == {'group0': 3}
+
+
+def test_ranking_includes_pending_usage(db, monkeypatch):
+    counter = UsageCounter()
+    monkeypatch.setattr(notification, 'usage_counter', counter)
+    bot = FakeBot()
+    populate(2, members=1)
+    Group.update(usage=5).where(Group.name == 'group0').execute()
+    chat_cache.clear()
+    assert ranking(bot) == ['group0', 'group1']
+
+    group = Group.get(Group.chat == USER_ID, Group.name == 'group1')
+    counter.increment(group.id, USER_ID, 6)
+    assert ranking(bot) == ['group1', 'group0']
+
+    # Once written, the usage comes from the database again
+    counter.flush()
+    assert ranking(bot) == ['group1', 'group0']
+    assert counter.pending(group.id) == 0
+
+
+# Support Functions
+# -----------------
+
+def ranking(bot):
+    """Titles of the groups offered to an empty inline query, best first."""
+    notification.inline_mode(bot, inline_query(bot, ''))
+    return [result['title'] for result in bot.calls[-1][2]['results']]
+
+
+def usages():
+    return {group.name: group.usage for group in Group.select().where(Group.chat == CHAT_ID)}
@@ -0,0 +1,36 @@
+import pytest
+
+from bot.controllers.validation import validate_alias, split_aliases
+
+
+# Tests
+# -----
+
+@pytest.mark.parametrize('alias, message', [
+    ('@alice', None),
+    ('bob_1', None),
+    ('@ali ce', 'Spaces are not accepted.'),
+    ('@@alice', 'Too many @ symbols.'),
+    ('alice@', 'Username starts with @.'),
+    ('@abc', 'Length of the username must be 3-32 symbols.'),
+    ('ab', 'Length of the username must be 3-32 symbols.'),
+    ('ali-ce', 'Invalid symbols in the username.'),
+    ('группа', 'Invalid symbols in the username.'),
+])
+def test_usernames(alias, message):
+    assert validate_alias(alias, use_at=True) == (message is None, message)
+
+
+@pytest.mark.parametrize('name, message', [
+    ('family', None),
+    ('группа_42', None),
+    ('@family', 'Invalid symbols in the username.'),
+    ('a' * 33, 'Length of the username must be 3-32 symbols.'),
+    ('mañana', 'Invalid symbols in the username.'),
+])
+def test_group_names(name, message):
+    assert validate_alias(name, use_at=False, use_alphabet=True) == (message is None, message)
+
+
+def test_split_aliases():
+    assert split_aliases(' @alice, bob\n@carol,,dave ') == ['@alice', 'bob', '@carol', 'dave']
@@ -0,0 +1,57 @@
+import time
+from threading import Event
+
+from bot.workers import ChatWorkerPool
+from bot.tests.fakes import FakeBot, message, inline_query
+
+
+# Tests
+# -----
+
+def test_superseded_inline_queries_are_dropped():
+    bot = FakeBot()
+    release, processed = Event(), []
+    pool = attached(ChatWorkerPool(workers=2), lambda update: release.wait(5) and processed.append(update))
+
+    updates = [message(bot, 'first'), inline_query(bot, 'g'), inline_query(bot, 'gr'), message(bot, 'second'),
+               inline_query(bot, 'gro')]
+    for update in updates:
+        pool.submit(update)
+    release.set()
+    pool.shutdown()
+
+    # Only the last of the waiting inline queries is answered, other updates keep their order
+    assert processed == [updates[0], updates[3], updates[4]]
+
+
+def test_updates_of_a_user_are_serialized_and_users_run_in_parallel():
+    bot = FakeBot()
+    spans = {}
+
+    def process_update(update):
+        started = time.perf_counter()
+        time.sleep(0.1)
+        spans[update.effective_message.text] = (started, time.perf_counter())
+
+    pool = attached(ChatWorkerPool(workers=4), process_update)
+    for update in [message(bot, 'one', user_id=1), message(bot, 'two', user_id=1), message(bot, 'other', user_id=2)]:
+        pool.submit(update)
+    pool.shutdown()
+
+    assert spans['two'][0] >= spans['one'][1]       # after the previous update of the same user
+    assert spans['other'][0] < spans['one'][1]      # while the other user is being served
+
+
+# Support Functions
+# -----------------
+
+class Dispatcher:
+    groups, handlers = [], {}
+
+    def __init__(self, process_update):
+        self.process_update = process_update
+
+
+def attached(pool, process_update):
+    pool.attach(Dispatcher(process_update))
+    return pool
@@ -1,29 +1,33 @@
 # coding: utf-8
 import logging
-from decouple import Config, RepositoryEnv
 from telegram.ext import *
 
-config = Config(RepositoryEnv('config.env'))
-updater = Updater(token=config('TOKEN'))
-dispatcher = updater.dispatcher
-
+from .settings import settings, SettingsWatcher
 from .controllers.groups import *
 from .controllers.notification import *
+from .controllers import admins
+from .workers import ChatWorkerPool, ThreadSafeConversationHandler
+from .metrics import metrics, instrument_handlers, instrument_database, instrument_bot, MetricsServer
+from .models import database, usage_counter
+from .outbox import outbox
+from .persistence import persistence
 
-
-if not config('DEBUG', cast=bool):
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        filename=f'{updater.bot.name.lower()[1:]}.log',
-        filemode='a+')
-else:
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+def configure_logging(settings=settings):
+    if not settings.debug:
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            filename=settings.log_file,
+            filemode='a+')
+    else:
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
 def start(bot, update):
     update.effective_message.reply_text(
         f'Hello. I can /create groups for you and keep all your friends inside them. '
@@ -38,6 +42,8 @@ def help(bot, update):
         message += '/groups - list of all of your groups'
     else:
         message += '/groups - list of all of chat groups'
+    message += '\n/export - download all of the groups as a file'
+    message += '\n/import - add groups from such a file'
     update.effective_message.reply_text(message)
 
 
@@ -52,83 +58,172 @@ def cancel(bot, update):
 
 def error(bot, update, error):
     """Log Errors caused by Updates."""
+    metrics.count(f'errors.{type(error).__name__}')
     logger.warning('Update "%s" caused error "%s"', update, error)
 
 
-# default commands
-dispatcher.add_error_handler(error)
-dispatcher.add_handler(CommandHandler('start', start))
-dispatcher.add_handler(CommandHandler('help', help))
-
-# inline mode
-dispatcher.add_handler(InlineQueryHandler(inline_mode))
-dispatcher.add_handler(ChosenInlineResultHandler(inline_chosen))
-
-# creating groups
-dispatcher.add_handler(ConversationHandler(
-    entry_points=[CommandHandler('create', group_create)],
-    states={
-        CREATE_GROUP: [
-            MessageHandler(Filters.text, group_create_complete)]},
-    fallbacks=[CommandHandler('cancel', cancel)]))
-
-# listing user's groups
-dispatcher.add_handler(CommandHandler('groups', group_list))
-dispatcher.add_handler(CallbackQueryHandler(group_open, pattern='group.list.', pass_user_data=True))
-
-# joining/leaving the group
-dispatcher.add_handler(CallbackQueryHandler(group_join, pattern='group.join.'))
-dispatcher.add_handler(CallbackQueryHandler(group_leave, pattern='group.leave.'))
-
-# adding members
-dispatcher.add_handler(ConversationHandler(
-    entry_points=[CallbackQueryHandler(group_add_members_enter, pattern='group.add.', pass_user_data=True)],
-    states={
-        GROUP_ADD_MEMBERS: [
-            CommandHandler('done', group_add_members_complete, pass_user_data=True),
-            MessageHandler(Filters.text, group_add_members, pass_user_data=True)]},
-    fallbacks=[CommandHandler('cancel', cancel)]))
-
-# removing members
-dispatcher.add_handler(ConversationHandler(
-    entry_points=[CallbackQueryHandler(group_remove_enter, pattern='group.remove.', pass_user_data=True)],
-    states={
-        GROUP_REMOVE_MEMBERS: [
-            CallbackQueryHandler(group_remove_exit, pattern='group.remove.exit', pass_user_data=True),
-            CallbackQueryHandler(group_remove_members, pattern='group.remove.member.', pass_user_data=True)]},
-    fallbacks=[CommandHandler('cancel', cancel)],
-    conversation_timeout=120))
-
-# renaming groups
-dispatcher.add_handler(ConversationHandler(
-    entry_points=[CallbackQueryHandler(group_rename_enter, pattern='group.rename.', pass_user_data=True)],
-    states={
-        GROUP_RENAME: [
-            MessageHandler(Filters.text, group_rename_complete, pass_user_data=True)]},
-    fallbacks=[CommandHandler('cancel', cancel)]))
-
-# deleting groups
-dispatcher.add_handler(ConversationHandler(
-    entry_points=[CallbackQueryHandler(group_delete_enter, pattern='group.delete.', pass_user_data=True)],
-    states={
-        GROUP_DELETE: [
-            CallbackQueryHandler(group_delete_complete, pass_user_data=True)]},
-    fallbacks=[CommandHandler('cancel', cancel)],
-    conversation_timeout=60))
-
-dispatcher.add_handler(ConversationHandler(
-    entry_points=[CallbackQueryHandler(group_copy_enter, pattern='group.copy.', pass_user_data=True)],
-    states={
-        GROUP_COPY: [
-            CallbackQueryHandler(group_copy_complete, pass_user_data=True)]},
-    fallbacks=[CommandHandler('cancel', cancel)],
-    conversation_timeout=60))
-
-# exiting from the group
-dispatcher.add_handler(CallbackQueryHandler(group_exit, pattern='group.exit'))
-
-# checking every message for mentioned groups
-dispatcher.add_handler(MessageHandler(Filters.text, check_every_message))
-
-# unexpected callback_queryies
-dispatcher.add_handler(CallbackQueryHandler(expired_session))
+def register_handlers(dispatcher):
+    # default commands
+    dispatcher.add_error_handler(error)
+    dispatcher.add_handler(CommandHandler('start', start))
+    dispatcher.add_handler(CommandHandler('help', help))
+
+    # inline mode
+    dispatcher.add_handler(InlineQueryHandler(inline_mode))
+    dispatcher.add_handler(ChosenInlineResultHandler(inline_chosen))
+
+    # creating groups
+    dispatcher.add_handler(ThreadSafeConversationHandler(
+        entry_points=[CommandHandler('create', group_create)],
+        states={
+            CREATE_GROUP: [
+                MessageHandler(Filters.text, group_create_complete)]},
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='create'))
+
+    # listing user's groups
+    dispatcher.add_handler(CommandHandler('groups', group_list))
+    dispatcher.add_handler(CallbackQueryHandler(group_open, pattern='group.list.', pass_user_data=True))
+
+    # joining/leaving the group
+    dispatcher.add_handler(CallbackQueryHandler(group_join, pattern='group.join.'))
+    dispatcher.add_handler(CallbackQueryHandler(group_leave, pattern='group.leave.'))
+
+    # adding members
+    dispatcher.add_handler(ThreadSafeConversationHandler(
+        entry_points=[CallbackQueryHandler(group_add_members_enter, pattern='group.add.', pass_user_data=True)],
+        states={
+            GROUP_ADD_MEMBERS: [
+                CommandHandler('done', group_add_members_complete, pass_user_data=True),
+                MessageHandler(Filters.text, group_add_members, pass_user_data=True)]},
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='add_members'))
+
+    # removing members
+    dispatcher.add_handler(ThreadSafeConversationHandler(
+        entry_points=[CallbackQueryHandler(group_remove_enter, pattern='group.remove.', pass_user_data=True)],
+        states={
+            GROUP_REMOVE_MEMBERS: [
+                CallbackQueryHandler(group_remove_exit, pattern='group.remove.exit', pass_user_data=True),
+                CallbackQueryHandler(group_remove_members, pattern='group.remove.member.', pass_user_data=True)]},
+        fallbacks=[CommandHandler('cancel', cancel)],
+        conversation_timeout=120,
+        name='remove_members'))
+
+    # renaming groups
+    dispatcher.add_handler(ThreadSafeConversationHandler(
+        entry_points=[CallbackQueryHandler(group_rename_enter, pattern='group.rename.', pass_user_data=True)],
+        states={
+            GROUP_RENAME: [
+                MessageHandler(Filters.text, group_rename_complete, pass_user_data=True)]},
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='rename'))
+
+    # deleting groups
+    dispatcher.add_handler(ThreadSafeConversationHandler(
+        entry_points=[CallbackQueryHandler(group_delete_enter, pattern='group.delete.', pass_user_data=True)],
+        states={
+            GROUP_DELETE: [
+                CallbackQueryHandler(group_delete_complete, pass_user_data=True)]},
+        fallbacks=[CommandHandler('cancel', cancel)],
+        conversation_timeout=60,
+        name='delete'))
+
+    dispatcher.add_handler(ThreadSafeConversationHandler(
+        entry_points=[CallbackQueryHandler(group_copy_enter, pattern='group.copy.', pass_user_data=True)],
+        states={
+            GROUP_COPY: [
+                CallbackQueryHandler(group_copy_complete, pass_user_data=True)]},
+        fallbacks=[CommandHandler('cancel', cancel)],
+        conversation_timeout=60,
+        name='copy'))
+
+    # exporting and importing groups
+    dispatcher.add_handler(CommandHandler('export', group_export, pass_args=True))
+    dispatcher.add_handler(ThreadSafeConversationHandler(
+        entry_points=[CommandHandler('import', group_import_enter)],
+        states={
+            GROUP_IMPORT: [
+                MessageHandler(Filters.document, group_import_complete)]},
+        fallbacks=[CommandHandler('cancel', cancel)],
+        conversation_timeout=300,
+        name='import'))
+
+    # exiting from the group
+    dispatcher.add_handler(CallbackQueryHandler(group_exit, pattern='group.exit'))
+
+    # forgetting cached admin statuses of joined/left members
+    dispatcher.add_handler(MessageHandler(
+        Filters.status_update.new_chat_members | Filters.status_update.left_chat_member,
+        admins.chat_members_changed))
+
+    # checking every message for mentioned groups
+    dispatcher.add_handler(MessageHandler(Filters.text, check_every_message))
+
+    # unexpected callback_queryies
+    dispatcher.add_handler(CallbackQueryHandler(expired_session))
+
+
+def create_updater(settings=settings, bot=None):
+    """Builds the Updater with all of the handlers. `bot` replaces the one created from the token, e.g. in tests."""
+    updater = Updater(token=None if bot else settings.token, bot=bot)
+    register_handlers(updater.dispatcher)
+    if persistence is not None:
+        persistence.attach(updater.dispatcher)
+
+    # collecting metrics of handlers, database and Bot API requests
+    if settings.metrics:
+        metrics.enabled = True
+        instrument_handlers(updater.dispatcher)
+        instrument_database(database)
+        instrument_bot(updater.bot)
+    return updater
+
+
+def create_worker_pool(dispatcher, settings=settings):
+    """Processes updates of the dispatcher on a pool of workers, if WORKERS is set. Returns the pool or None."""
+    if not settings.workers:
+        return None
+    worker_pool = ChatWorkerPool(settings.workers)
+    worker_pool.attach(dispatcher)
+    return worker_pool
+
+
+class BackgroundServices:
+    """Background threads of bot.py and bot_async.py.
+
+    The usage counter, persistence, outbox, settings watcher and metrics server.
+    """
+
+    def __init__(self, settings=settings):
+        self.settings = settings
+        self.settings_watcher = None
+        self.metrics_server = None
+
+    def start(self):
+        usage_counter.start()
+        if persistence:
+            persistence.start()
+        outbox.start()
+        if self.settings.reload_interval:
+            self.settings_watcher = SettingsWatcher(self.settings, self.settings.reload_interval)
+            self.settings_watcher.start()
+        if metrics.enabled:
+            self.metrics_server = MetricsServer(
+                listen=self.settings.metrics_listen,
+                port=self.settings.metrics_port,
+                log_interval=self.settings.metrics_log_interval)
+            self.metrics_server.start()
+
+    def stop(self):
+        """Sends the queued messages and writes the pending changes. The outbox may already be stopped."""
+        outbox.stop()
+        usage_counter.stop()
+        if persistence:
+            persistence.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.settings_watcher:
+            self.settings_watcher.stop()
+            self.settings_watcher = None
@@ -0,0 +1,142 @@
+# coding: utf-8
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, local
+
+from telegram import Update
+from telegram.ext import ConversationHandler
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+UPDATE_KINDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'inline_query',
+                'chosen_inline_result', 'callback_query', 'shipping_query', 'pre_checkout_query')
+
+
+class ThreadSafeConversationHandler(ConversationHandler):
+    """ConversationHandler, that can be used from several dispatcher threads.
+
+    ConversationHandler keeps the matched conversation on the instance between
+    `check_update` and `handle_update`. Here it is kept per thread instead.
+    The same conversation is never processed by two threads at once, because
+    ChatWorkerPool serializes updates of the same user.
+
+    Conversations of a handler with a `name` are stored by the persistence
+    attached to it (see bot.persistence). A conversation missing from memory
+    is looked up there, it may have been started by another process.
+    """
+
+    def __init__(self, *args, name=None, **kwargs):
+        self._current = local()
+        self.name = name
+        self.persistence = None
+        super().__init__(*args, **kwargs)
+
+    def update_state(self, new_state, key):
+        super().update_state(new_state, key)
+        if self.persistence is not None:
+            self.persistence.update_conversation(self.name, key, self.conversations.get(key))
+
+    def _get_key(self, update):
+        key = super()._get_key(update)
+        if self.persistence is not None and key not in self.conversations:
+            self.persistence.restore_conversation(self, key)
+        return key
+
+    @property
+    def current_conversation(self):
+        return getattr(self._current, 'conversation', None)
+
+    @current_conversation.setter
+    def current_conversation(self, value):
+        self._current.conversation = value
+
+    @property
+    def current_handler(self):
+        return getattr(self._current, 'handler', None)
+
+    @current_handler.setter
+    def current_handler(self, value):
+        self._current.handler = value
+
+
+class ChatWorkerPool:
+    """Processes updates of a dispatcher on a pool of threads.
+
+    Updates with the same key (the user, or the chat for updates without a user)
+    are processed strictly one after another, so conversation states and
+    `user_data` are never touched concurrently. Updates with different keys are
+    processed in parallel.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker')
+        self._queues = {}  # key -> deque of updates waiting for the running one
+        self._lock = Lock()
+        self._process_update = None
+
+    def attach(self, dispatcher):
+        self._process_update = dispatcher.process_update
+        dispatcher.process_update = self.submit
+
+    def submit(self, update):
+        if not isinstance(update, Update):
+            return self._process_update(update)  # polling errors
+
+        task = (_kind(update), time.perf_counter(), update)
+        metrics.gauge(f'queue.{task[0]}', 1)
+        key = update_key(update)
+        with self._lock:
+            if key in self._queues:
+                if task[0] == 'inline_query':
+                    self._drop_superseded(self._queues[key])
+                self._queues[key].append(task)
+                return
+            self._queues[key] = deque()
+        self._executor.submit(self._run, key, task)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _drop_superseded(self, queue):
+        """A newer inline query of the user makes the queued ones pointless, nobody will see their answers."""
+        for task in [task for task in queue if task[0] == 'inline_query']:
+            queue.remove(task)
+            metrics.gauge('queue.inline_query', -1)
+            metrics.count('inline.superseded')
+
+    def _run(self, key, task):
+        while task is not None:
+            kind, queued, update = task
+            metrics.gauge(f'queue.{kind}', -1)
+            metrics.observe(f'queue_wait.{kind}', time.perf_counter() - queued)
+            try:
+                self._process_update(update)
+            except Exception:
+                logger.exception('An uncaught error was raised while processing the update')
+
+            with self._lock:
+                queue = self._queues[key]
+                task = queue.popleft() if queue else None
+                if task is None:
+                    del self._queues[key]
+
+
+def update_key(update):
+    """Updates with the same key are processed in order: the user, or the chat for updates without a user."""
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+def _kind(update):
+    for kind in UPDATE_KINDS:
+        if getattr(update, kind, None) is not None:
+            return kind
+    return 'unknown'
@@ -0,0 +1,44 @@
+# coding: utf-8
+import asyncio
+import signal
+
+from telegram import Bot
+
+from bot.settings import settings
+from bot.updater import configure_logging, create_updater, BackgroundServices
+from bot.models.migrations import migrate
+from bot.outbox import outbox
+from bot.aio.client import AsyncBotClient, LoopRequest
+from bot.aio.runtime import AsyncRuntime
+
+
+async def main(runtime, updater):
+    try:
+        await runtime.run()
+    finally:
+        # The outbox sends the rest of its queue through the loop, so it has to stop while the loop runs
+        await asyncio.get_event_loop().run_in_executor(None, outbox.stop)
+        updater.job_queue.stop()
+
+
+if __name__ == '__main__':
+    configure_logging()
+    migrate()
+    loop = asyncio.get_event_loop()
+    client = AsyncBotClient(settings.token, base_url=settings.api_url, connections=settings.async_connections)
+    updater = create_updater(bot=Bot(settings.token, request=LoopRequest(client, loop)))
+    runtime = AsyncRuntime(client, updater.dispatcher,
+                           workers=settings.async_workers,
+                           max_updates=settings.async_max_updates)
+
+    services = BackgroundServices()
+    services.start()
+    updater.job_queue.start()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, runtime.stop)
+    try:
+        loop.run_until_complete(main(runtime, updater))
+    finally:
+        client.close()
+        loop.close()
+    services.stop()